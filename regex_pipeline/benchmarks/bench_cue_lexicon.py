@@ -0,0 +1,43 @@
+""" Microbenchmark of the per-token cue lookup of the dependency attribution: the quote verb list against the frozen
+    set of CueLexicon.forms.
+    Run from regex_pipeline/: python benchmarks/bench_cue_lexicon.py [--model en_core_web_sm]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from utils.patterns import quote_verbs, cue_lexicon
+
+SAMPLE = ('“We need to invest around £100bn in the electricity system alone by 2020,” Flint told the Observer. '
+          'The minister said that the plan was on track, adding: “We are confident.” '
+          'Critics warned that costs were rising and argued that households would pay the price. ')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--model', help='spacy model to tokenise with (default: a blank English pipeline)')
+    parser.add_argument('--repeat', type=int, default=200, help='copies of the sample text')
+    args = parser.parse_args()
+
+    import spacy
+    nlp = spacy.load(args.model) if args.model else spacy.blank('en')
+    tokens = list(nlp(SAMPLE * args.repeat))
+    cue_verbs = cue_lexicon.forms
+
+    candidates = {
+        'list membership': lambda: [tok.text in quote_verbs for tok in tokens],
+        'CueLexicon.forms': lambda: [tok.text in cue_verbs for tok in tokens],
+    }
+    expected = candidates['list membership']()
+    print(f'{len(tokens)} tokens, {len(quote_verbs)} cues')
+    for name, lookup in candidates.items():
+        assert lookup() == expected, name
+        seconds = min(timeit.repeat(lookup, number=5, repeat=5)) / 5
+        print(f'{name:>20}: {seconds / len(tokens) * 1e9:8.1f} ns/token')
+
+
+if __name__ == '__main__':
+    main()
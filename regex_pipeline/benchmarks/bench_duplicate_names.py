@@ -0,0 +1,74 @@
+""" Scaling benchmark of `remove_duplicate_names` (the names of an article that are also peers) against the previous
+    nested loops, which search every word of every part of every name in every peer name with a regex, over the number
+    of names of an article. Both must give the same names.
+    Run from regex_pipeline/: python benchmarks/bench_duplicate_names.py [--sizes 25 50 100 200 400]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from utils.functions_spacy3 import remove_duplicate_names
+
+FIRST_NAMES = ['Caroline', 'Boris', 'Keir', 'Nicola', 'Rishi', 'Osama', 'Kim', 'Angela', 'Sean', 'Mary', 'Ed', 'Anne']
+SURNAMES = ['Flint', 'Johnson', 'Starmer', 'Sturgeon', 'Sunak', 'Laden', 'Jong-Un', 'McDonald', "O'Grady", 'Evans',
+            'Smith-Porter', 'Merkel', 'MacLeod', 'Hale', 'Patel', 'Smith', 'Jones', 'Ahmed', 'Williams', 'Brown']
+TITLES = ['Lord', 'Baroness', 'Lady', 'Baron']
+# Enough surnames for the larger articles
+SURNAME_POOL = [surname + ending for surname in SURNAMES for ending in ('', 'son', 'ley', 'ton', 'ford', 'field')]
+
+
+def previous_remove_duplicate_names(names, other_names):
+    """ remove_duplicate_names before the word index """
+    out = []
+    for name in names:
+        names_split = name.split()
+        for i in range(len(names_split) + 1, 0, -1):
+            for n in range(0, len(names_split) + 1 - i):
+                names_join = ' '.join(names_split[n:n + i])
+                for n in names_split:
+                    for name in other_names:
+                        if re.search(r"\b" + n + r"\b", name):
+                            out.append(names_join)
+    clean_names = [name for name in names if name not in out]
+    return clean_names
+
+
+def make_names(rng, n_names):
+    """ Returns: the names of an article (single names and full names, some with a middle name) and its peers """
+    names = []
+    for _ in range(n_names):
+        r = rng.random()
+        if r < 0.2:
+            names.append(rng.choice(FIRST_NAMES + SURNAME_POOL))
+        else:
+            names.append(' '.join([rng.choice(FIRST_NAMES)] + rng.sample(SURNAME_POOL, 2 if r > 0.9 else 1)))
+    peers = [f'{rng.choice(TITLES)} {rng.choice(SURNAME_POOL)}' for _ in range(n_names // 5)]
+    return names, peers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[25, 50, 100, 200, 400], help='names per article')
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    for n_names in args.sizes:
+        names, peers = make_names(rng, n_names)
+        timings = []
+        for remove in (previous_remove_duplicate_names, remove_duplicate_names):
+            start = time.perf_counter()
+            result = remove(names, peers)
+            timings.append((time.perf_counter() - start, result))
+        (previous_time, previous), (new_time, new) = timings
+        assert new == previous, (names, peers)
+        print(f'{n_names:5d} names, {len(peers):3d} peers: previous {previous_time * 1000:8.2f} ms, '
+              f'remove_duplicate_names {new_time * 1000:6.2f} ms ({len(names) - len(new)} names removed)')
+
+
+if __name__ == '__main__':
+    main()
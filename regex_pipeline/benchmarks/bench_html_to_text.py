@@ -0,0 +1,111 @@
+""" Benchmark of the HTML to text conversion of CAPI articles: `remove_all_html` (BeautifulSoup, two parses) against
+    the single-pass `html_to_text`, on synthetic articles in the CAPI markup. Both must give the same text, and the
+    paragraph offsets of `html_to_text` must be the starts of the lines of that text. The edge cases follow the
+    beautifulsoup4 version of requirements.txt, later versions changed a few (e.g. CDATA in a template).
+    Run from regex_pipeline/: python benchmarks/bench_html_to_text.py [--articles 500]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from utils.preprocessing import remove_all_html, html_to_text
+
+SPEAKERS = ['Flint', 'the prime minister', 'a spokesperson for the department', 'O’Grady', 'the chancellor']
+CUES = ['said', 'told the Observer', 'added', 'says', 'warned']
+WORDS = ['energy', 'prices', 'will', 'rise', 'again', 'this', 'winter', 'we', 'need', 'to', 'invest', 'more',
+         'households', 'AT&amp;T', 'the', 'plan', '&nbsp;', '£100bn']
+
+
+def make_sentence(rng):
+    words = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(6, 25)))
+    if rng.random() < 0.3:
+        words = words.replace(' the ', ' <a href="https://www.theguardian.com/uk">the</a> ', 1)
+    if rng.random() < 0.5:
+        return f'“{words.capitalize()},” {rng.choice(SPEAKERS)} {rng.choice(CUES)}.'
+    return f'{words.capitalize()}.'
+
+
+def make_article(rng, n_paragraphs=25):
+    """ Returns: HTML of an article body as CAPI gives it: paragraphs, subheadings, embedded figures, asides and
+        spans, links and line breaks
+    """
+    parts = []
+    for _ in range(n_paragraphs):
+        r = rng.random()
+        if r < 0.08:
+            parts.append(f'<h2>{make_sentence(rng)}</h2>')
+        elif r < 0.14:
+            parts.append('<figure class="element element-image"><img src="https://i.guim.co.uk/img.jpg" alt="">'
+                         f'<figcaption><span class="element-image__caption">{make_sentence(rng)}</span>'
+                         '</figcaption></figure>')
+        elif r < 0.18:
+            parts.append(f'<aside class="element element-rich-link"><p><span>Related: </span>'
+                         f'<a href="https://www.theguardian.com/politics">{make_sentence(rng)}</a></p></aside>')
+        else:
+            sentences = ' '.join(make_sentence(rng) for _ in range(rng.randint(1, 4)))
+            if rng.random() < 0.1:
+                sentences += f'<br>{make_sentence(rng)}'
+            if rng.random() < 0.1:
+                sentences += f' <span class="drop-cap">{make_sentence(rng)}</span>'
+            parts.append(f'<p>{sentences}</p>')
+    return rng.choice(['', ' ', '  ', '\n']).join(parts)
+
+
+def make_markup(rng, n_tokens=40):
+    """ Returns: random markup (unbalanced tags, comments, entities, white space) to compare the edge cases """
+    tags = ['p', 'p', 'a', 'span', 'h2', 'aside', 'figure', 'strong', 'em', 'div', 'blockquote', 'li', 'script',
+            'template', 'pre']
+    texts = ['', ' ', '  ', '\n', '\t', 'Hello', '“Quote,”', ' said Ann.', 'O’Grady', '”.“', '&amp;', '&amp', '&#147;',
+             'a < b']
+    other = ['<br>', '<br/>', '<br class="x">', '</br>', '<img src="x">', '<p/>', '<!-- c -->', '<!DOCTYPE html>',
+             '<![CDATA[cd]]>']
+    attributes = ['', '', ' class="x"']
+    out = []
+    for _ in range(rng.randrange(1, n_tokens)):
+        r = rng.random()
+        if r < 0.3:
+            out.append(f'<{rng.choice(tags)}{rng.choice(attributes)}>')
+        elif r < 0.55:
+            out.append(f'</{rng.choice(tags)}>')
+        elif r < 0.6:
+            out.append(rng.choice(other))
+        else:
+            out.append(rng.choice(texts))
+    return ''.join(out)
+
+
+def check(html):
+    text, paragraph_starts = html_to_text(html)
+    assert text == remove_all_html(html), html
+    assert paragraph_starts == [0] + [i + 1 for i, c in enumerate(text) if c == '\n'], html
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--articles', type=int, default=500, help='number of synthetic articles')
+    parser.add_argument('--markup', type=int, default=5000, help='number of random markup snippets to compare')
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    articles = [make_article(rng) for _ in range(args.articles)]
+    for html in articles:
+        check(html)
+    for _ in range(args.markup):
+        check(make_markup(rng))
+    print(f'Same text for {len(articles)} articles and {args.markup} markup snippets')
+
+    size = sum(len(html) for html in articles) / 1e6
+    for name, convert in (('remove_all_html', remove_all_html), ('html_to_text', html_to_text)):
+        start = time.perf_counter()
+        for html in articles:
+            convert(html)
+        elapsed = time.perf_counter() - start
+        print(f'{name:>15}: {elapsed / len(articles) * 1000:6.2f} ms/article, {size / elapsed:5.2f} MB/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+""" Import-time benchmark: cold imports of the pipeline modules, each in a fresh interpreter started outside this
+    folder (as a batch worker would be), and which heavy libraries they pull in.
+    Run from regex_pipeline/: python benchmarks/bench_import_time.py [--runs 10] [--baseline REF]
+    --baseline checks a git revision (e.g. HEAD~1) out in a temporary work tree and times it from its own
+    regex_pipeline/ folder, since older revisions can only be imported from there.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+PIPELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+MODULES = ['utils.regex_quotes', 'utils.quote_extraction', 'utils.corpus']
+HEAVY = ['spacy', 'bs4', 'requests']
+
+SNIPPET = '''
+import sys, time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start, ','.join(name for name in {heavy!r} if name in sys.modules))
+'''
+
+
+def time_import(module, pipeline_dir, runs, cwd):
+    """ Returns: (list of seconds, heavy modules imported) """
+    env = dict(os.environ, PYTHONPATH=pipeline_dir)
+    timings = []
+    heavy = ''
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', SNIPPET.format(module=module, heavy=HEAVY)], cwd=cwd,
+                                env=env, check=True, capture_output=True, text=True).stdout.split(' ')
+        timings.append(float(output[0]))
+        heavy = output[1].strip()
+    return timings, heavy
+
+
+def report(label, pipeline_dir, runs, cwd):
+    print(label)
+    for module in MODULES:
+        try:
+            timings, heavy = time_import(module, pipeline_dir, runs, cwd)
+        except subprocess.CalledProcessError as error:
+            print(f'  {module:<25} failed: {error.stderr.strip().splitlines()[-1]}')
+            continue
+        print(f'  {module:<25} {statistics.median(timings) * 1000:8.1f} ms (median of {runs})  '
+              f'imports: {heavy or "-"}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--runs', type=int, default=10, help='fresh interpreters per module')
+    parser.add_argument('--baseline', help='git revision to compare with')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cwd:
+        report('current tree (from another directory)', PIPELINE_DIR, args.runs, cwd)
+    if args.baseline:
+        with tempfile.TemporaryDirectory() as worktree:
+            subprocess.run(['git', 'worktree', 'add', '--detach', worktree, args.baseline], cwd=PIPELINE_DIR,
+                           check=True, capture_output=True)
+            try:
+                baseline_dir = os.path.join(worktree, 'regex_pipeline')
+                report(f'{args.baseline} (from its regex_pipeline/ folder)', baseline_dir, args.runs, baseline_dir)
+            finally:
+                subprocess.run(['git', 'worktree', 'remove', '--force', worktree], cwd=PIPELINE_DIR, check=True)
+
+
+if __name__ == '__main__':
+    main()
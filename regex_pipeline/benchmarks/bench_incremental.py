@@ -0,0 +1,113 @@
+""" Regression check and benchmark of the incremental extraction: synthetic articles are edited a paragraph at a time
+    (edited, inserted, deleted or appended) and every version is extracted with `IncrementalExtractor` and again from
+    scratch. Both must give the same quotes, offsets included. The paragraphs mix the patterns, 'adding' quotes and
+    unbalanced quote marks, whose matches run over the paragraph breaks. The regex-only engine is used, so no model
+    is needed. The orphan quotes of the first sentence are checked beforehand in 'full' mode with a blank English
+    pipeline.
+    Run from regex_pipeline/: python benchmarks/bench_incremental.py [--articles 100 --versions 6]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from utils.incremental import IncrementalExtractor
+from utils.quote_extraction import extract_quotes_and_sentence_speaker
+from utils.regex_quotes import extract_regex_quotes
+
+SENTENCES = ['“We will win,” she said, adding: “It is done.”', '“Fine,” Flint said, adding: “Next.”',
+             'He said, adding: “Nothing”', '“A,” said Mr Starmer, adding: “B” and “C”.', 'Mr Starmer said',
+             '“We are not there yet,” the spokesperson said.', 'Later Mr Jones told reporters: “It is over.”',
+             'adding: “Later”', '“Q,” he added: “R.”', 'It rained in London.', 'Lord Smith said: “No.”',
+             '“An open quote', 'closed here”', '“A whole paragraph in quote marks.”', 'She said, adding: “x” “y”',
+             '“Unbalanced, said nobody']
+# An article starting with a paragraph in quote marks, which has no previous sentence to be an orphan quote of
+ORPHAN_PARAGRAPHS = ['“This is a standalone quote.”', 'It rained in London.', 'Mr Jones arrived late.',
+                     'The meeting was short.', 'Nobody asked.', 'Lord Smith left early.', '“Another line,” Smith said.']
+
+
+def extract(text, unique=True):
+    return extract_regex_quotes(text, unique=unique)
+
+
+def quotes_key(quotes):
+    return Counter(json.dumps(dict(quote.to_dict(), start=quote.start, end=quote.end), sort_keys=True)
+                   for quote in quotes)
+
+
+def check_orphans():
+    """ Checks the orphan quotes of an article starting with a paragraph in quote marks when a paragraph next to it is
+        edited, then its last paragraph (whose sentence would otherwise come before the first one) """
+    import spacy
+    nlp = spacy.blank('en')
+
+    def extract_full(text, unique=True):
+        return extract_quotes_and_sentence_speaker(text, nlp, mode='full', unique=unique)
+
+    extractor = IncrementalExtractor(extract_full)
+    paragraphs = list(ORPHAN_PARAGRAPHS)
+    extractor.update('orphans', '\n'.join(paragraphs))
+    for i, paragraph in ((2, 'The meeting was long.'), (len(paragraphs) - 1, 'Smith left.')):
+        paragraphs[i] = paragraph
+        text = '\n'.join(paragraphs)
+        assert quotes_key(extractor.update('orphans', text)) == quotes_key(extract_full(text)[0]), text
+    print('Same orphan quotes for an article starting with a quote')
+
+
+def make_paragraph(rng):
+    return ' '.join(rng.choice(SENTENCES) for _ in range(rng.randint(1, 3)))
+
+
+def edit(rng, paragraphs):
+    """ Edits, inserts, deletes or appends a paragraph of `paragraphs` in place """
+    i = rng.randrange(len(paragraphs))
+    operation = rng.choice(['edit', 'insert', 'delete', 'append'])
+    if operation == 'edit':
+        paragraphs[i] = make_paragraph(rng)
+    elif operation == 'insert':
+        paragraphs.insert(i, make_paragraph(rng))
+    elif operation == 'delete' and len(paragraphs) > 1:
+        del paragraphs[i]
+    else:
+        paragraphs.append(make_paragraph(rng))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--articles', type=int, default=100, help='number of synthetic articles')
+    parser.add_argument('--versions', type=int, default=6, help='edited versions of every article')
+    parser.add_argument('--paragraphs', type=int, default=40, help='largest number of paragraphs of an article')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    check_orphans()
+    rng = random.Random(args.seed)
+    extractor = IncrementalExtractor(extract)
+    n_versions = 0
+    incremental_time = full_time = 0.0
+    for article_id in range(args.articles):
+        paragraphs = [make_paragraph(rng) for _ in range(rng.randint(2, args.paragraphs))]
+        extractor.update(article_id, '\n'.join(paragraphs))
+        for _ in range(args.versions):
+            edit(rng, paragraphs)
+            text = '\n'.join(paragraphs)
+            start = time.perf_counter()
+            incremental = extractor.update(article_id, text)
+            incremental_time += time.perf_counter() - start
+            start = time.perf_counter()
+            full, _ = extract(text)
+            full_time += time.perf_counter() - start
+            assert quotes_key(incremental) == quotes_key(full), text
+            n_versions += 1
+    print(f'Same quotes for {n_versions} versions of {args.articles} articles ({dict(extractor.counters)})')
+    print(f'{"incremental":>12}: {incremental_time / n_versions * 1000:6.3f} ms/version')
+    print(f'{"full":>12}: {full_time / n_versions * 1000:6.3f} ms/version')
+
+
+if __name__ == '__main__':
+    main()
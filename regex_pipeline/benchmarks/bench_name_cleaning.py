@@ -0,0 +1,186 @@
+""" Benchmark of the cleaning of the PERSON entities of an article: `cleaning_names` (a NameNormaliser) against the
+    previous list passes, on synthetic articles with hundreds of PERSON mentions. Both must give the same names.
+    Run from regex_pipeline/: python benchmarks/bench_name_cleaning.py [--articles 200 --mentions 400]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+from functools import reduce
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from utils.functions_spacy3 import NameNormaliser, cleaning_names, replace, drop, remove
+
+FIRST_NAMES = ['Caroline', 'Boris', 'Keir', 'Nicola', 'Rishi', 'Osama', 'Kim', 'Angela', 'Sean', 'Mary', 'Ed']
+SURNAMES = ['Flint', 'Johnson', 'Starmer', 'Sturgeon', 'Sunak', 'Laden', 'Jong-Un', 'McDonald', 'al-Assad', "O'Grady",
+            'Smith-Porter', 'Street', 'Merkel', 'MacLeod']
+# What spacy tends to grab with a name
+AROUND = ['Mr ', 'Dr ', 'Sir ', 'Prince ', 'the ', 'Labour leader ', 'BBC ', '', '', '', '']
+AFTER = ["'s", "'", ' - who', ' QC', ', ', '. The', ' (', ' pic.twitter.com/abc', ' 2019', '', '', '', '', '']
+OTHERS = ['Brexit', 'NHS England', 'Greater Manchester', 'Met Office', 'Tube', 'The Queen', 'someone', 'UN',
+          'Bin', 'Jim Crow', 'Twitter', 'news@theguardian.com']
+
+
+def previous_cleaning_names(names):
+    """ cleaning_names before the NameNormaliser """
+    # remove twitter pictures
+    twitter_pic_free = [re.sub(r'[^\s]*pic.twitter.com[^\s]*', '', name) for name in names]
+    # remove parts from the replace list
+    names_replace = [reduce(lambda str, e: str.replace(e, ''), replace, name) for name in twitter_pic_free]
+    # remove strings with numbers
+    no_digits = [name for name in names_replace if not re.search(r'\d', name)]
+    # remove string in ALL lower
+    no_lower = [name for name in no_digits if not name.islower()]
+    # remove strings in ALL upper
+    no_upper = [name for name in no_lower if not name.isupper()]
+    # remove strings which start with 'the '
+    no_the = [name for name in no_upper if name not in [name for name in no_upper if name.lower().startswith('the ')]]
+    # remove words afrer '. ' when it grabs the beggining of the next sentence
+    after_stop = [name.split('. ', 1)[0] for name in no_the]
+
+    # split names separated by comma when Spacy grabs them together
+    comma_free = []
+    for name in after_stop:
+        if ', ' not in name:
+            comma_free.append(name)
+        else:
+            for i in range(len(name.split(', '))):
+                comma_free.append(name.split(', ')[i])
+
+    # remove ' - who' etc.
+    no_hyphen = [re.sub(r'(\ - .*$)', '', name) for name in comma_free]
+    # remove email addresses
+    no_email = [re.sub(r'[^\s]*@[^\s]*', '', name) for name in no_hyphen]
+    # remove strings with & char
+    no_special_char = [name for name in no_email if '&' not in name]
+    # remove words before ''s ' when it's not part of the name
+    s_names = [name.split("'s ", 1)[-1] for name in no_special_char]
+    # remove 's and ' at the end of the name
+    names_s = [re.sub(r"'s$|'$", '', name) for name in s_names]
+    # remove long -, (, +
+    no_sintax = [re.sub(r'(\— )', '', name) for name in names_s]
+    no_sintax = [re.sub(r'( \()', '', name) for name in no_sintax]
+    no_sintax = [re.sub(r'(\+)', '', name) for name in no_sintax]
+    # remove - from the end
+    no_end_dash = [name[:-2] if name.endswith(' -') else name for name in no_sintax]
+    # al-Assad == Assad == Al-Assad
+    no_al = [re.sub(r'(al-)|(Al-)', '', name) for name in no_end_dash]
+    # remove BBC, NHS etc. and MoJ etc. but not Smith-Porter
+    no_abr = []
+    for name in no_al:
+        if not re.search(r'(\w*[A-Z]\w*[A-Z]\w*)', name):
+            no_abr.append(name)
+        elif re.search(r'(Mc[A-Z]|Mac[A-Z])', name):
+            no_abr.append(name)
+
+    # remove empty strings
+    no_empty = [i for i in no_abr if len(i) > 0]
+
+    # set to lower then back to capwords - Kim Jong-Un == Kim Jong-un
+    names_cap = [name for name in no_empty if name.istitle() or name.title() not in no_empty]
+    names_unique = list(set(names_cap))
+
+    clean_names = [name for name in names_unique if name.lower() not in [e.lower() for e in remove]]
+
+    # check surnames against full names
+    lonely_names = [name.split(' ')[0] for name in clean_names if ' ' not in name]  # grab lonely(!) names
+
+    double_surnames = [name.split(' ')[-2] + ' ' + name.split(' ')[-1] for name in clean_names \
+                       if ' ' in name and len(name.split(' ')) == 3]
+
+    first_double_surnames = [name.split(' ')[0] for name in double_surnames]
+    second_double_surnames = [name.split(' ')[1] for name in double_surnames]
+
+    first_names = [name.split(' ')[0] for name in clean_names if ' ' in name \
+                   and name.split(' ')[0] not in first_double_surnames]  # grab first names from full names
+    surnames = [name.split(' ')[-1] for name in clean_names if ' ' in name and len(name.split(' ')) == 2 \
+                and name.split(' ')[1] not in second_double_surnames]  # grab last names
+
+    # common in English where the surname is only the third name and the second shouldn't be included.
+    surnames += second_double_surnames
+
+    full_names = [name for name in clean_names if ' ' in name and name not in double_surnames]  # grab full names
+
+    # Rule Osama Laden == Osama Bin Laden == Osama Laden
+    names_to_drop = []
+    for i in range(1, len(full_names)):
+
+        if full_names[i].split(' ')[0] == full_names[i - 1].split(' ')[0] \
+                and full_names[i].split(' ')[-1] == full_names[i - 1].split(' ')[-1]:
+            names_to_drop.append(full_names[i])
+
+    for name in names_to_drop:
+        full_names.remove(name)
+
+    first_names_surnamesfree = []
+    for name in lonely_names:
+        if name not in surnames and name not in second_double_surnames:
+            first_names_surnamesfree.append(name)
+
+    first_names_duplicatesfree = []
+    for name in first_names_surnamesfree:
+        if name not in first_names:
+            first_names_duplicatesfree.append(name)
+
+    names_unique_new = first_names_duplicatesfree + full_names
+
+    # drop part of names from the drop list
+    names_drop = [name for name in names_unique_new if not any(e.lower() in name.lower().split(' ') for e in drop)]
+    # drop names from the removal list
+
+    # list_of_names is a list of all PERSON entities in the article
+    names_dict = {}
+    names_with_middle = []
+    for i in range(1, len(clean_names)):
+        if clean_names[i].split(' ')[0] == clean_names[i - 1].split(' ')[0] \
+                and clean_names[i].split(' ')[-1] == clean_names[i - 1].split(' ')[-1]:
+            names_dict[clean_names[i]] = clean_names[i - 1]
+            names_with_middle.append(clean_names[i])
+
+    return names_drop, surnames, first_names_duplicatesfree
+
+
+def make_mention(rng):
+    r = rng.random()
+    if r < 0.1:
+        return rng.choice(OTHERS)
+    name = rng.choice(FIRST_NAMES) if r < 0.3 else rng.choice(SURNAMES) if r < 0.5 else \
+        ' '.join([rng.choice(FIRST_NAMES)] + rng.sample(SURNAMES, rng.choice([1, 1, 1, 2])))
+    if rng.random() < 0.05:
+        name = name.lower() if rng.random() < 0.5 else name.upper()
+    mention = rng.choice(AROUND) + name + rng.choice(AFTER)
+    if mention.endswith(', '):
+        mention += rng.choice(FIRST_NAMES) + ' ' + rng.choice(SURNAMES)
+    return mention
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--articles', type=int, default=200, help='number of synthetic articles')
+    parser.add_argument('--mentions', type=int, default=400, help='PERSON mentions per article')
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    articles = [[make_mention(rng) for _ in range(args.mentions)] for _ in range(args.articles)]
+    # Small articles too, where most names only appear once
+    articles += [[make_mention(rng) for _ in range(rng.randint(0, 20))] for _ in range(args.articles)]
+    for names in articles:
+        assert cleaning_names(names) == previous_cleaning_names(names), names
+    print(f'Same names for {len(articles)} articles')
+
+    articles = articles[:args.articles]
+    # A new normaliser, so that no name is in its cache yet
+    normaliser = NameNormaliser(replace, drop, remove)
+    for name, clean in (('previous', previous_cleaning_names), ('NameNormaliser', normaliser.clean)):
+        start = time.perf_counter()
+        for names in articles:
+            clean(names)
+        elapsed = time.perf_counter() - start
+        print(f'{name:>15}: {elapsed / len(articles) * 1000:6.2f} ms/article of {args.mentions} mentions')
+
+
+if __name__ == '__main__':
+    main()
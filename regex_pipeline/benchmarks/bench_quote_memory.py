@@ -0,0 +1,105 @@
+""" Memory benchmark of the Quote records: the quotes of a synthetic corpus kept in memory as `utils.classes.Quote` and
+    as the previous Quote class (an instance dict, every string its own copy, the hash rebuilt on every call).
+    Run from regex_pipeline/: python benchmarks/bench_quote_memory.py [--articles 2000]
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from utils.regex_quotes import extract_regex_quotes
+
+SPEAKERS = ['Flint', 'the prime minister', 'a spokesperson for the department', 'Johnson', 'the chancellor',
+            'a Downing Street source', 'Sturgeon', 'the mayor of London']
+CUES = ['said', 'told the Observer', 'added', 'says', 'warned']
+
+
+class PreviousQuote:
+    """ The Quote class before the compact record """
+    def __init__(self, quote_text, speaker=None, quote_text_optional_second_part=None, cue=None, additional_cue=None,
+                 quote_text_optional_third_part=None, start=None, end=None):
+        self.quote_text = quote_text
+        self.speaker = speaker
+        self.quote_text_optional_second_part = quote_text_optional_second_part
+        self.cue = cue
+        self.additional_cue = additional_cue
+        self.quote_text_optional_third_part = quote_text_optional_third_part
+        self.start = start
+        self.end = end
+        self._QUOTE_TYPE = None
+
+    def __eq__(self, other):
+        return all([self.quote_text == other.quote_text, self.speaker == other.speaker,
+                    self.quote_text_optional_second_part == other.quote_text_optional_second_part,
+                    self.cue == other.cue])
+
+    def __hash__(self):
+        if self.quote_text_optional_second_part is None:
+            return hash(f"{self.quote_text} {self.speaker} {self.cue}")
+        else:
+            return hash(f"{self.quote_text} {self.speaker} {self.cue} {self.quote_text_optional_second_part}")
+
+
+def make_article(rng, n_paragraphs=30):
+    paragraphs = []
+    for _ in range(n_paragraphs):
+        words = ' '.join(rng.choice(['energy', 'prices', 'will', 'rise', 'again', 'this', 'winter', 'we', 'need',
+                                     'to', 'invest', 'more']) for _ in range(rng.randint(8, 30)))
+        paragraphs.append(f'“{words.capitalize()},” {rng.choice(SPEAKERS)} {rng.choice(CUES)}. '
+                          f'The figures were published on Tuesday.')
+    return '\n'.join(paragraphs)
+
+
+def copy_to_previous(quote):
+    # Strings as they come out of separate regex matches: equal, but separate objects
+    copy = lambda value: None if value is None else ''.join(list(value))
+    previous = PreviousQuote(copy(quote.quote_text), copy(quote.speaker), copy(quote.quote_text_optional_second_part),
+                             copy(quote.cue), copy(quote.additional_cue), copy(quote.quote_text_optional_third_part),
+                             quote.start, quote.end)
+    previous._QUOTE_TYPE = quote.QUOTE_TYPE
+    return previous
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--articles', type=int, default=2000, help='number of synthetic articles')
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    articles = [make_article(rng) for _ in range(args.articles)]
+
+    # The articles stay in memory in both cases, so only the quotes are measured. The regexes and quote verbs are
+    # loaded before measuring.
+    extract_regex_quotes(articles[0])
+    quotes, quote_size = measure(lambda: [quote for article in articles for quote in extract_regex_quotes(article)[0]])
+    previous, previous_size = measure(lambda: [copy_to_previous(quote) for quote in quotes])
+
+    assert [quote.to_dict()['quote_text'] for quote in quotes] == [quote.quote_text for quote in previous]
+    assert [hash(quote) for quote in quotes] == [hash(quote) for quote in previous]
+
+    print(f'{len(quotes)} quotes from {len(articles)} articles')
+    print(f'{"previous Quote":>15}: {previous_size / len(quotes):7.1f} bytes/quote')
+    print(f'{"Quote":>15}: {quote_size / len(quotes):7.1f} bytes/quote')
+    for name, records in (('previous Quote', previous), ('Quote', quotes)):
+        start = time.perf_counter()
+        for _ in range(5):
+            set(records)
+        print(f'{name:>15}: {(time.perf_counter() - start) / 5 * 1000:7.1f} ms per set() of all the quotes')
+
+
+if __name__ == '__main__':
+    main()
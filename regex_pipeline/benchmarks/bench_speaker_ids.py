@@ -0,0 +1,71 @@
+""" Checks and benchmark of the speaker ids: the full names and ids found for noisy regex speakers (sentence starts,
+    the end of the previous sentence, pronouns, titles, peers sharing a name), then the cost per quote of building the
+    index of an article and resolving its speakers, over the number of speakers of the article.
+    Run from regex_pipeline/: python benchmarks/bench_speaker_ids.py [--sizes 10 100 1000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from utils.speakers import article_full_names, royal_index
+
+# (text of the article, speakers of its quotes, {speaker: expected id})
+CASES = [
+    ('', ['Yesterday Boris Johnson', 'Johnson'],
+     {'Yesterday Boris Johnson': 'Boris Johnson', 'Boris Johnson': 'Boris Johnson', 'Johnson': 'Boris Johnson'}),
+    ('', ['…tweeted He. Flint', 'Labour MP Caroline Flint'],
+     {'…tweeted He. Flint': 'Caroline Flint', 'Flint': 'Caroline Flint', 'He Flint': 'Caroline Flint'}),
+    ('', ['He Flint', 'Flint'], {'Flint': None, 'He Flint': None, 'he': None}),
+    ('', ['“We are. Said Ann Smith', 'Then Chris Flint', 'Caroline Flint'],
+     {'Ann Smith': 'Ann Smith', 'Smith': 'Ann Smith', 'Flint': None, 'Mr Chris Flint': 'Chris Flint'}),
+    ('', ['President Joe Biden', 'Sir Keir Starmer', 'Boris Johnson, the prime minister'],
+     {'Biden': 'Joe Biden', 'Mr Starmer': 'Keir Starmer', 'the prime minister': None, 'Johnson': 'Boris Johnson'}),
+    ('Lord Smith spoke before Baroness Smith replied.', ['Lord Smith', 'Baroness Smith'],
+     {'Lord Smith': 'Lord Smith', 'Baroness Smith': 'Baroness Smith', 'Smith': None}),
+    ('Lady Diana was there.', ['the Duke of Sussex', 'Meghan Markle'],
+     {'the Duke of Sussex': 'Prince Harry', 'Lady Diana': 'Princess Diana', 'Markle': 'Meghan Markle',
+      'The Queen’s': 'The Queen'}),
+]
+
+FIRST_NAMES = ['Caroline', 'Boris', 'Keir', 'Nicola', 'Rishi', 'Angela', 'Sean', 'Mary', 'Ed', 'Anne', 'Priti']
+SURNAMES = ['Flint', 'Johnson', 'Starmer', 'Sturgeon', 'Sunak', 'McDonald', 'Evans', 'Merkel', 'Patel', 'Jones']
+PREFIXES = ['', '', 'Mr ', 'Yesterday ', 'Labour MP ', 'the former minister ', 'Later ']
+
+
+def check():
+    for text, speakers, expected in CASES:
+        index = royal_index().for_article(text, article_full_names(speakers))
+        for speaker, entity_id in expected.items():
+            assert index.resolve(speaker) == entity_id, (speakers, speaker, index.resolve(speaker), entity_id)
+    print(f'Expected ids for {sum(len(expected) for _, _, expected in CASES)} speakers of {len(CASES)} articles')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000], help='speakers per article')
+    args = parser.parse_args()
+
+    check()
+    rng = random.Random(0)
+    surnames = [surname + ending for surname in SURNAMES for ending in ('', 'son', 'ley', 'ton', 'ford')]
+    for size in args.sizes:
+        speakers = []
+        for _ in range(size):
+            name = f'{rng.choice(FIRST_NAMES)} {rng.choice(surnames)}'
+            speakers.append(rng.choice(PREFIXES) + rng.choice([name, name.split()[-1], 'he', 'the Queen']))
+        start = time.perf_counter()
+        index = royal_index().for_article('Lord Smith said.', article_full_names(speakers))
+        built = time.perf_counter()
+        for speaker in speakers:
+            index.resolve(speaker)
+        resolved = time.perf_counter()
+        print(f'{size:>6} speakers: index {(built - start) / size * 1e6:6.1f} us/speaker, '
+              f'resolve {(resolved - built) / size * 1e6:6.1f} us/speaker')
+
+
+if __name__ == '__main__':
+    main()
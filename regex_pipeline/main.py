@@ -1,9 +1,17 @@
 import sys
 import logging
-import json
-import spacy
+import argparse
+from collections import deque
 
-from utils.quote_extraction import extract_quotes_and_sentence_speaker
+from utils.constants import MODES
+from utils.regex_quotes import MATCHERS, DEFAULT_WINDOW
+from utils.corpus import iter_articles, iter_capi_articles, extract_corpus, extract_corpus_parallel
+from utils.guard import RegexGuard
+from utils.preprocessing import BLOCKED_TRACKING_TAGS, NEWS_PILLAR
+from utils.checkpoint import Checkpoint, checkpoint_path, pending_articles, run_version
+from utils.writers import COMPRESSIONS, ShardedJsonlWriter, ParquetQuoteWriter
+
+OUTPUT_FORMATS = ('jsonl', 'parquet')
 
 # Utility functions
 def check_if_fname_exists(fname):
@@ -27,23 +35,185 @@ def get_text_from_input(input_):
         return input_
 
 
-# Quote extraction
-def run_one(text, model_name='en_core_web_trf', debug=True):
+def load_model(model_name, doc_cache=None, doc_cache_size=1024):
+    """ Load the spacy model, behind a persistent DocCache stored in `doc_cache` if a path is given.
+        Returns: spacy model """
+    import spacy
     nlp = spacy.load(model_name)
-    results = extract_quotes_and_sentence_speaker(text, nlp, debug)
+    if doc_cache:
+        from utils.cache import DocCache
+        nlp = DocCache(nlp, doc_cache, doc_cache_size)
+    return nlp
+
+
+def log_cache_stats(nlp):
+    if hasattr(nlp, 'stats'):
+        stats = nlp.stats()
+        logging.info(f"Doc cache: {stats['hits']} hits, {stats['misses']} misses, "
+                     f"{stats['entries']} Docs ({stats['size_mb']:.1f}MB)")
+
+
+# Quote extraction
+def run_one(text, model_name='en_core_web_trf', debug=True, doc_cache=None, doc_cache_size=1024, mode='full',
+            **options):
+    if mode == 'regex_only':
+        from utils.regex_quotes import extract_regex_quotes
+        return extract_regex_quotes(text, debug, **options)
+
+    from utils.quote_extraction import extract_quotes_and_sentence_speaker
+    nlp = load_model(model_name, doc_cache, doc_cache_size)
+    results = extract_quotes_and_sentence_speaker(text, nlp, debug, mode=mode, **options)
+    log_cache_stats(nlp)
     return results
 
-def write_jsonl(data, path):
-    import srsly
-    srsly.write_jsonl(path, [d.to_dict() for d in data])
-    logging.info(f"Output witten to {output_path}")
+def run_corpus(path, output_path, model_name='en_core_web_trf', id_key='id', text_key='text', n_workers=1,
+               chunk_size=20, debug=False, doc_cache=None, doc_cache_size=1024, mode='full', shard_size_mb=None,
+               compression='none', output_format='jsonl', row_group_size=100000, checkpoint=False,
+               incremental=None, capi=False, read_batch_size=1000, pillar=NEWS_PILLAR,
+               blocked_tags=BLOCKED_TRACKING_TAGS, **options):
+    """ Extract quotes from every article in `path` (a JSONL file or a directory, see `iter_articles`).
+        The model is loaded once and one line per article ({"id": ..., "quotes": [...]}) is written to
+        `output_path` as soon as the article is processed. With `n_workers` > 1 the articles are processed by a
+        pool of forked workers sharing the model (see `extract_corpus_parallel`); the output order is unchanged.
+        With `doc_cache` the parses are stored in (and read from) a persistent DocCache at that path. `mode` selects
+        the stages of the extraction (see MODES); no model is loaded in 'regex_only' mode. Other keyword arguments
+        (e.g. matcher, window, guard) are passed on to the extraction. An article whose regular expressions were cut
+        short by a RegexGuard gets a "status" field describing it. With `shard_size_mb` or `compression` the lines are
+        written to shards listed in a manifest instead (see ShardedJsonlWriter). With `output_format` 'parquet', one row
+        per quote is written to a Parquet file instead, in row groups of `row_group_size` quotes (see
+        ParquetQuoteWriter). With `checkpoint` the run keeps a checkpoint next to the JSONL output (see
+        utils.checkpoint.Checkpoint) and, when one from a run of the same pipeline version is there, resumes it: the
+        articles it lists with unchanged content are skipped and the new records are added to its output. With
+        `incremental`, the path of a state file, articles seen in an earlier run are only extracted again where their
+        paragraphs changed (see utils.incremental.IncrementalExtractor). With `capi`, `path` is a CAPI export (JSONL or
+        Parquet) with the HTML of the articles, read in batches of `read_batch_size` records and filtered to the
+        `pillar` without the `blocked_tags` (see utils.corpus.iter_capi_articles). With `speaker_ids` in the options,
+        every quote gets the canonical id of its speaker (see utils.speakers.SpeakerAliasIndex).
+        Returns: number of articles processed """
+    nlp = load_model(model_name, doc_cache, doc_cache_size) if mode != 'regex_only' else None
+    if capi:
+        articles = iter_capi_articles(path, id_key, text_key, read_batch_size, pillar, blocked_tags)
+    else:
+        articles = iter_articles(path, id_key, text_key)
+    run_checkpoint = None
+    if checkpoint:
+        if output_format != 'jsonl':
+            raise ValueError("Checkpoints are only kept for the JSONL output")
+        run_checkpoint = Checkpoint(checkpoint_path(output_path),
+                                    run_version(nlp, mode, shard_size_mb=shard_size_mb, compression=compression,
+                                                **options))
+        hashes = deque()
+        articles = pending_articles(articles, run_checkpoint, hashes)
+    if output_format == 'parquet':
+        writer = ParquetQuoteWriter(output_path, row_group_size)
+        options['offsets'] = True
+    elif run_checkpoint is not None:
+        writer = ShardedJsonlWriter(output_path, shard_size_mb, compression, on_flush=run_checkpoint.on_flush,
+                                    resume_shards=run_checkpoint.shards)
+    else:
+        writer = ShardedJsonlWriter(output_path, shard_size_mb, compression)
+    incremental_state = None
+    if incremental:
+        if n_workers > 1:
+            raise ValueError("The incremental state can only be kept by a single process")
+        import shelve
+        incremental_state = options['incremental'] = shelve.open(incremental)
+    if n_workers > 1:
+        results = extract_corpus_parallel(articles, nlp, n_workers, chunk_size, debug, mode, **options)
+    else:
+        results = extract_corpus(articles, nlp, debug, mode, **options)
+    n_articles = 0
+    n_quotes = 0
+    with writer:
+        for article_id, quotes, status in results:
+            record = {"id": article_id, "quotes": quotes}
+            if status is not None:
+                record["status"] = status
+            position = writer.write(record)
+            if run_checkpoint is not None:
+                run_checkpoint.add(article_id, hashes.popleft(), position)
+            n_articles += 1
+            n_quotes += len(quotes)
+    if run_checkpoint is not None:
+        run_checkpoint.close()
+    if incremental_state is not None:
+        incremental_state.close()
+    logging.info(f"{n_quotes} quotes from {n_articles} articles written to {output_path}")
+    log_cache_stats(nlp)
+    if options.get('guard') is not None:
+        options['guard'].log_stats()
+    return n_articles
+
+def write_jsonl(data, path, shard_size_mb=None, compression='none'):
+    """ Writes one line per quote of `data` to `path` as they come (see ShardedJsonlWriter for the sharded and
+        compressed output) """
+    with ShardedJsonlWriter(path, shard_size_mb, compression) as writer:
+        for quote in data:
+            writer.write(quote.to_dict(), n_quotes=1)
+    logging.info(f"Output written to {path}")
 
 if __name__ == "__main__":
-    output_path = './data/quotes_results.jsonl'
-    try:
-        inp = sys.argv[1]
-    except IndexError:
+    parser = argparse.ArgumentParser(description='Regular expression quote extraction')
+    parser.add_argument('input', nargs='?', help='text to process or the name of a file containing it')
+    parser.add_argument('--corpus', help='JSONL file or directory of articles to process with a single model load')
+    parser.add_argument('--output', default='./data/quotes_results.jsonl', help='where to write the results')
+    parser.add_argument('--model', default='en_core_web_trf', help='spacy model to load')
+    parser.add_argument('--id-key', default='id', help='article id field of the corpus JSONL records')
+    parser.add_argument('--text-key', default='text', help='article text field of the corpus JSONL records')
+    parser.add_argument('--workers', type=int, default=1, help='number of worker processes for corpus mode')
+    parser.add_argument('--chunk-size', type=int, default=20, help='articles sent to a worker at a time')
+    parser.add_argument('--mode', choices=MODES, default='full', help='stages of the extraction to run')
+    parser.add_argument('--matcher', choices=MATCHERS, default='scan', help='how the regular expressions are matched')
+    parser.add_argument('--window', type=int, default=DEFAULT_WINDOW,
+                        help="characters around each quote searched by the 'window' matcher")
+    parser.add_argument('--pattern-timeout', type=float, default=1.0,
+                        help='seconds one regular expression may run on an article (0 for no limit)')
+    parser.add_argument('--article-timeout', type=float, default=5.0,
+                        help='seconds all the regular expressions may run on an article (0 for no limit)')
+    parser.add_argument('--max-length', type=int, default=500000,
+                        help='characters of an article that are processed (0 for no limit)')
+    parser.add_argument('--doc-cache', help='SQLite file of a persistent cache of the spacy parses')
+    parser.add_argument('--doc-cache-size', type=float, default=1024, help='size limit of the Doc cache in MB')
+    parser.add_argument('--shard-size', type=float, default=0,
+                        help='size limit in MB of the output shards, listed in a manifest (0 for a single file)')
+    parser.add_argument('--compression', choices=COMPRESSIONS, default='none', help='compression of the output')
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='jsonl',
+                        help='format of the corpus output: JSON lines, or a Parquet file with one row per quote')
+    parser.add_argument('--row-group-size', type=int, default=100000, help='quotes per row group of the Parquet output')
+    parser.add_argument('--incremental',
+                        help='state file of the earlier versions of the articles, to only re-extract changed paragraphs')
+    parser.add_argument('--checkpoint', action='store_true',
+                        help='keep a checkpoint of the corpus run and resume the one left next to the output, if any')
+    parser.add_argument('--capi', action='store_true',
+                        help='the corpus is a CAPI export (JSONL or Parquet) with the HTML of the articles')
+    parser.add_argument('--read-batch-size', type=int, default=1000,
+                        help='records of the CAPI export read and filtered at a time')
+    parser.add_argument('--pillar', default=NEWS_PILLAR, help="pillar of the CAPI articles kept ('' for all)")
+    parser.add_argument('--blocked-tags', nargs='*', default=sorted(BLOCKED_TRACKING_TAGS),
+                        help='tracking tags of the CAPI articles left out')
+    parser.add_argument('--speaker-ids', action='store_true',
+                        help='add the canonical id of the speaker (royals, peers, full names) to every quote')
+    args = parser.parse_args()
+
+    output_path = args.output
+    guard = RegexGuard(args.pattern_timeout or None, args.article_timeout or None, args.max_length or None)
+    if args.corpus:
+        run_corpus(args.corpus, output_path, args.model, args.id_key, args.text_key, args.workers,
+                   args.chunk_size, doc_cache=args.doc_cache, doc_cache_size=args.doc_cache_size, mode=args.mode,
+                   shard_size_mb=args.shard_size or None, compression=args.compression, output_format=args.format,
+                   row_group_size=args.row_group_size, checkpoint=args.checkpoint,
+                   incremental=args.incremental, capi=args.capi, read_batch_size=args.read_batch_size,
+                   pillar=args.pillar or None, blocked_tags=args.blocked_tags, speaker_ids=args.speaker_ids,
+                   matcher=args.matcher, window=args.window, guard=guard)
+        sys.exit(0)
+
+    inp = args.input
+    if inp is None:
         inp = input('Specify input text file.')
     text = get_text_from_input(inp)
-    output, sentences = run_one(text, debug=False)
-    write_jsonl(output, output_path)
+    output, sentences = run_one(text, args.model, debug=False, doc_cache=args.doc_cache,
+                                doc_cache_size=args.doc_cache_size, mode=args.mode, matcher=args.matcher,
+                                window=args.window, guard=guard)
+    if guard.status() is not None:
+        logging.warning(f"Regular expressions cut short: {guard.status()}")
+    write_jsonl(output, output_path, args.shard_size or None, args.compression)
@@ -0,0 +1,128 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+
+from spacy.tokens import Doc
+
+
+class DocCache:
+    """ Persistent cache of spacy Docs in front of a spacy model, stored in a local SQLite file.
+        It is used in place of the model: calling it or its `pipe` returns the cached Doc when the same text has been
+        parsed by the same model (name and version) before, and parses and stores it otherwise. This makes re-runs
+        over unchanged text (e.g. after changing the regexes or the quote verb list) skip the model entirely.
+        The file is kept under `max_size_mb` by evicting the least recently used Docs.
+
+        Hits and misses are counted per process. A cache forked into worker processes opens its own connection in
+        each of them.
+
+        :param nlp_model: spacy model
+        :param path: SQLite file of the cache, created if needed
+        :param max_size_mb: size limit of the stored Docs
+    """
+    # How many new Docs are stored between two checks of the size limit
+    evict_every = 100
+
+    def __init__(self, nlp_model, path: str, max_size_mb: float = 1024):
+        self.nlp_model = nlp_model
+        self.path = path
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.model_key = f"{nlp_model.meta.get('lang')}_{nlp_model.meta.get('name')}-{nlp_model.meta.get('version')}"
+        self.hits = 0
+        self.misses = 0
+        self._connection = None
+        self._pid = None
+        self._puts_since_evict = 0
+
+    def __getattr__(self, name):
+        # Anything else (vocab, meta, pipe_names...) is the model's
+        if name == 'nlp_model':
+            raise AttributeError(name)
+        return getattr(self.nlp_model, name)
+
+    @property
+    def connection(self):
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = sqlite3.connect(self.path, timeout=60)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS docs '
+                                     '(key TEXT PRIMARY KEY, data BLOB NOT NULL, size INTEGER NOT NULL, '
+                                     'last_used REAL NOT NULL)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS docs_last_used ON docs (last_used)')
+            self._connection.commit()
+            self._pid = os.getpid()
+        return self._connection
+
+    def key(self, text: str):
+        return hashlib.sha1(f"{self.model_key}\n{text}".encode('utf8')).hexdigest()
+
+    def get(self, text: str):
+        """ Returns: the cached Doc of `text`, or None """
+        key = self.key(text)
+        row = self.connection.execute('SELECT data FROM docs WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.connection.execute('UPDATE docs SET last_used = ? WHERE key = ?', (time.time(), key))
+        return Doc(self.nlp_model.vocab).from_bytes(row[0])
+
+    def put(self, text: str, doc):
+        # The tensors and user data (e.g. transformer outputs) are not used downstream and are most of a Doc's size
+        data = doc.to_bytes(exclude=['tensor', 'user_data'])
+        self.connection.execute('INSERT OR REPLACE INTO docs (key, data, size, last_used) VALUES (?, ?, ?, ?)',
+                                (self.key(text), data, len(data), time.time()))
+        self._puts_since_evict += 1
+        if self._puts_since_evict >= self.evict_every:
+            self.evict()
+
+    def evict(self):
+        """ Deletes the least recently used Docs until the cache is under its size limit """
+        self._puts_since_evict = 0
+        connection = self.connection
+        total_size = connection.execute('SELECT COALESCE(SUM(size), 0) FROM docs').fetchone()[0]
+        if total_size > self.max_size:
+            to_free = total_size - self.max_size
+            keys = []
+            for key, size in connection.execute('SELECT key, size FROM docs ORDER BY last_used'):
+                keys.append((key,))
+                to_free -= size
+                if to_free <= 0:
+                    break
+            connection.executemany('DELETE FROM docs WHERE key = ?', keys)
+            logging.debug(f"Evicted {len(keys)} Docs from {self.path}")
+        connection.commit()
+
+    def __call__(self, text: str):
+        doc = self.get(text)
+        if doc is None:
+            doc = self.nlp_model(text)
+            self.put(text, doc)
+        self.connection.commit()
+        return doc
+
+    def pipe(self, texts, batch_size: int = None):
+        """ `nlp.pipe` with the cache: only the texts that are not cached are sent to the model.
+            Returns: generator of spacy Docs, in the order of `texts`
+        """
+        texts = list(texts)
+        docs = [self.get(text) for text in texts]
+        missing = [i for i, doc in enumerate(docs) if doc is None]
+        parsed = self.nlp_model.pipe([texts[i] for i in missing], batch_size=batch_size)
+        for i, doc in zip(missing, parsed):
+            docs[i] = doc
+            self.put(texts[i], doc)
+        self.connection.commit()
+        return iter(docs)
+
+    def stats(self):
+        """ Returns: dict with the hits and misses of this process and the number and size of the cached Docs """
+        entries, size = self.connection.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM docs').fetchone()
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries, 'size_mb': size / 1024 / 1024}
+
+    def close(self):
+        if self._connection is not None and self._pid == os.getpid():
+            self._connection.commit()
+            self._connection.close()
+        self._connection = None
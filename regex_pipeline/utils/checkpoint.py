@@ -0,0 +1,164 @@
+import hashlib
+import json
+import logging
+import os
+import pkgutil
+
+from .writers import copy_shards
+
+
+########################################################
+## Checkpoints of corpus runs
+########################################################
+
+# The files whose content decides the quotes extracted from an article
+PIPELINE_FILES = ('classes.py', 'constants.py', 'context.py', 'functions_spacy3.py', 'lexicon.py', 'patterns.py',
+                  'preprocessing.py', 'quote_extraction.py', 'regex_quotes.py', 'speakers.py', 'quote_verb_list.txt')
+
+
+def pipeline_fingerprint():
+    """ Returns: hash of the code and quote verb list of the extraction, which changes whenever they do """
+    digest = hashlib.sha1()
+    for name in PIPELINE_FILES:
+        digest.update(name.encode('utf8'))
+        digest.update(pkgutil.get_data(__package__, name))
+    return digest.hexdigest()
+
+
+def content_hash(text: str):
+    """ Returns: hash of the text of an article """
+    return hashlib.sha1(text.encode('utf8')).hexdigest()
+
+
+class Checkpoint:
+    """ Checkpoint manifest of a corpus run, so that a run that stopped can be resumed where it stopped, and a re-run
+        over the same archive only processes the articles that changed.
+        It records the id, content hash and output position (shard and line) of every article written, and the
+        `version` of the run (the pipeline fingerprint, the model and the extraction options). It is kept as a JSON
+        lines log next to the output: every time the writer flushes its records to disk, one line with the articles of
+        those records and the state of the output shards is appended, so the checkpoint never lists a record that is
+        not in the output, and a line cut short by a crash is ignored. When an article is written again (its content
+        changed), the line of its earlier record is marked as superseded in the writer's shards, which the manifest
+        lists for the readers to skip (see `utils.writers.iter_output`).
+        A checkpoint written with another `version` is discarded and the run starts from the beginning.
+
+        :param path: checkpoint file, e.g. ./data/quotes_results.checkpoint.jsonl
+        :param version: dict describing what produced the output (see `run_version`)
+    """
+    def __init__(self, path: str, version: dict):
+        self.path = path
+        self.version = version
+        # Article id -> [content hash, shard, line]
+        self.articles = {}
+        self.shards = []
+        self._pending = []
+        self._file = None
+        self.resumed = self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, 'rt', encoding='utf8') as fin:
+            lines = fin.read().split('\n')
+        try:
+            header = json.loads(lines[0])
+        except ValueError:
+            header = {}
+        if header.get('version') != self.version:
+            logging.info(f"Checkpoint {self.path} is from another pipeline version, starting from the beginning")
+            return False
+        valid_lines = 1
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Cut short by a crash
+                break
+            for article_id, text_hash, shard, offset in entry['articles']:
+                self.articles[article_id] = [text_hash, shard, offset]
+            self.shards = entry['shards']
+            valid_lines += 1
+        self._valid_lines = lines[:valid_lines]
+        logging.info(f"Resuming from {self.path}: {len(self.articles)} articles already done")
+        return True
+
+    def is_done(self, article_id, text_hash: str):
+        """ Returns: whether the article with this id and content hash is already in the output """
+        entry = self.articles.get(article_id)
+        return entry is not None and entry[0] == text_hash
+
+    def add(self, article_id, text_hash: str, position):
+        """ Records that the article is at `position` (shard, line) of the output, once the output is flushed """
+        self._pending.append([article_id, text_hash, position[0], position[1]])
+
+    def on_flush(self, writer):
+        """ To be called once the records of the added articles are on disk: marks the records they replace as
+            superseded, and appends them and the `writer` shards """
+        if self._file is None:
+            self._open()
+        for article_id, text_hash, shard, offset in self._pending:
+            previous = self.articles.get(article_id)
+            if previous is not None:
+                writer.supersede(previous[1], previous[2])
+            self.articles[article_id] = [text_hash, shard, offset]
+        self.shards = copy_shards(writer.shards)
+        self._file.write(json.dumps({'articles': self._pending, 'shards': self.shards}, ensure_ascii=False) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = []
+
+    def _open(self):
+        if self.resumed:
+            # Rewritten without any line cut short by a crash before carrying on
+            with open(self.path + '.tmp', 'wt', encoding='utf8') as fout:
+                fout.write('\n'.join(self._valid_lines) + '\n')
+            os.replace(self.path + '.tmp', self.path)
+            self._file = open(self.path, 'at', encoding='utf8')
+        else:
+            self._file = open(self.path, 'wt', encoding='utf8')
+            self._file.write(json.dumps({'version': self.version}) + '\n')
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def checkpoint_path(output_path: str):
+    """ Returns: path of the checkpoint of the output `output_path` (e.g. quotes_results.checkpoint.jsonl) """
+    root = output_path[:-len('.jsonl')] if output_path.endswith('.jsonl') else output_path
+    return root + '.checkpoint.jsonl'
+
+
+def pending_articles(articles, checkpoint: Checkpoint, hashes):
+    """ Leaves out the articles that `checkpoint` has with the same content, and appends the content hash of every
+        other article to `hashes` (a deque), in order, for its `Checkpoint.add` once extracted.
+        Returns: generator of (article_id, text) tuples
+    """
+    n_skipped = 0
+    for article_id, text in articles:
+        text_hash = content_hash(text)
+        if checkpoint.is_done(article_id, text_hash):
+            n_skipped += 1
+            continue
+        hashes.append(text_hash)
+        yield article_id, text
+    if n_skipped:
+        logging.info(f"{n_skipped} articles already in the output were skipped")
+
+
+def run_version(nlp_model=None, mode='full', **options):
+    """ Returns: dict of what decides the output of a corpus run: the pipeline fingerprint, the model name and version
+        and the extraction options (e.g. matcher, window and the limits of a RegexGuard)
+    """
+    version = {'pipeline': pipeline_fingerprint(), 'mode': mode}
+    if nlp_model is not None:
+        meta = nlp_model.meta
+        version['model'] = f"{meta.get('lang')}_{meta.get('name')}-{meta.get('version')}"
+    for name, value in sorted(options.items()):
+        if name == 'guard':
+            if value is not None:
+                version['guard'] = [value.pattern_budget, value.article_budget, value.max_length]
+        else:
+            version[name] = value
+    return version
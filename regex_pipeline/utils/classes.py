@@ -1,14 +1,83 @@
+import sys
+
+
+def _intern(value):
+    # Speakers and cues repeat across the quotes of an article and of a corpus, so only one copy of each is kept
+    return sys.intern(value) if type(value) is str else value
+
+
 class Quote:
+    """ A quote and its attribution.
+        Quotes are kept by the million in corpus runs, so the record is compact: it has no instance dict, its speaker
+        and cues are interned and its hash is computed once (and again only if a field it depends on changes).
+        When `quote_text` is None and the `article` it comes from is given, the quote text is read from the article
+        at `start`:`end` instead of being stored a second time.
+
+        :param start: character offset of quote_text in the article, when known
+        :param end: character offset of the end of quote_text in the article (excluded), when known
+        :param article: the text of the article, to read quote_text from
+    """
+    __slots__ = ('_quote_text', '_article', '_speaker', '_quote_text_optional_second_part', '_cue', 'additional_cue',
+                 'quote_text_optional_third_part', 'start', 'end', '_QUOTE_TYPE', '_hash')
+
     def __init__(self, quote_text: str, speaker: str = None, quote_text_optional_second_part: str = None,
-                 cue: str = None, additional_cue: str = None, quote_text_optional_third_part:str = None):
-        self.quote_text = quote_text
-        self.speaker = speaker
-        self.quote_text_optional_second_part = quote_text_optional_second_part
-        self.cue = cue
-        self.additional_cue = additional_cue
+                 cue: str = None, additional_cue: str = None, quote_text_optional_third_part:str = None,
+                 start: int = None, end: int = None, article: str = None):
+        if quote_text is None and article is not None and start is not None and end is not None:
+            self._quote_text = None
+            self._article = article
+        else:
+            self._quote_text = quote_text
+            self._article = None
+        self._speaker = _intern(speaker)
+        self._quote_text_optional_second_part = quote_text_optional_second_part
+        self._cue = _intern(cue)
+        self.additional_cue = _intern(additional_cue)
         self.quote_text_optional_third_part = quote_text_optional_third_part
+        # Character offsets of quote_text in the article (end excluded), when known
+        self.start = start
+        self.end = end
         self._QUOTE_TYPE = None
+        self._hash = None
 
+    @property
+    def quote_text(self):
+        if self._article is not None:
+            return self._article[self.start:self.end]
+        return self._quote_text
+
+    @quote_text.setter
+    def quote_text(self, value: str):
+        self._quote_text = value
+        self._article = None
+        self._hash = None
+
+    @property
+    def speaker(self):
+        return self._speaker
+
+    @speaker.setter
+    def speaker(self, value: str):
+        self._speaker = _intern(value)
+        self._hash = None
+
+    @property
+    def quote_text_optional_second_part(self):
+        return self._quote_text_optional_second_part
+
+    @quote_text_optional_second_part.setter
+    def quote_text_optional_second_part(self, value: str):
+        self._quote_text_optional_second_part = value
+        self._hash = None
+
+    @property
+    def cue(self):
+        return self._cue
+
+    @cue.setter
+    def cue(self, value: str):
+        self._cue = _intern(value)
+        self._hash = None
 
     @property
     def QUOTE_TYPE(self):
@@ -19,13 +88,7 @@ class Quote:
         self._QUOTE_TYPE = value
 
     def __repr__(self):
-        return str({"quote_text": self.quote_text,
-                    "speaker": self.speaker,
-                    "quote_text_optional_second_part": self.quote_text_optional_second_part,
-                    "cue": self.cue,
-                    "additional_cue": self.additional_cue,
-                    "quote_text_optional_third_part": self.quote_text_optional_third_part,
-                    "QUOTE_TYPE": self.QUOTE_TYPE})
+        return str(self.to_dict())
 
     def to_dict(self):
         return {"quote_text": self.quote_text,
@@ -46,7 +109,9 @@ class Quote:
             return False
 
     def __hash__(self):
-        if self.quote_text_optional_second_part is None:
-            return hash(f"{self.quote_text} {self.speaker} {self.cue}")
-        else:
-            return hash(f"{self.quote_text} {self.speaker} {self.cue} {self.quote_text_optional_second_part}")
+        if self._hash is None:
+            if self.quote_text_optional_second_part is None:
+                self._hash = hash(f"{self.quote_text} {self.speaker} {self.cue}")
+            else:
+                self._hash = hash(f"{self.quote_text} {self.speaker} {self.cue} {self.quote_text_optional_second_part}")
+        return self._hash
@@ -3,3 +3,9 @@ currency_punc_list = ['£', '$', '€']
 open_quote_mark = '“'
 close_quote_mark = '”'
 generic_quote = '"'
+
+# Stages run by extract_quotes_and_sentence_speaker:
+#   regex_only: regular expressions only, spacy is never called
+#   regex+parse: the regex speakers are refined with the dependency parse of their sentence
+#   full: as regex+parse, plus orphan quotes attributed from the previous sentence
+MODES = ('regex_only', 'regex+parse', 'full')
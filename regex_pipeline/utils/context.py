@@ -0,0 +1,132 @@
+from bisect import bisect_right
+
+from .preprocessing import Sentence, QuoteIndex, sentence_spans
+
+
+class ArticleContext:
+    """ One article as seen by the pipeline: its text, its sentences (from `sentence_spans`, the same split as
+        `sentencise_text`) and the spacy Docs of everything that has been parsed for it so far.
+        The sentences are kept as offsets into the text (`spans`) and only copied into strings when needed, and the
+        quote marks are found once (`quote_index`) for the sentence split and every later stage.
+        Docs are cached by text and only parsed on first use, so a sentence needed by several stages (sentence
+        parse, orphan quotes, entity lists) goes through the model once.
+
+        :param text: the pre-processed text of an article
+        :param nlp_model: spacy model
+        :param sentences: the sentences of `text`, if they have already been computed
+    """
+    def __init__(self, text: str, nlp_model, sentences: list = None):
+        self.text = text
+        self.nlp_model = nlp_model
+        self.quote_index = QuoteIndex.from_text(text)
+        if sentences is None:
+            self.spans = sentence_spans(text, self.quote_index)
+            self._sentences = None
+        else:
+            self.spans = []
+            position = 0
+            for sent in sentences:
+                position = text.index(sent, position)
+                self.spans.append(Sentence(text, position, position + len(sent)))
+                position += len(sent)
+            self._sentences = sentences
+        self._docs = {}
+        self._sentence_starts = None
+        self._quote_indices = None
+
+    def __len__(self):
+        return len(self.spans)
+
+    @property
+    def sentences(self):
+        """ The text of every sentence, copied out of the article on first use """
+        if self._sentences is None:
+            self._sentences = [str(span) for span in self.spans]
+        return self._sentences
+
+    def sentence(self, sent_index: int):
+        """ Returns: the text of sentence `sent_index` """
+        if self._sentences is not None:
+            return self._sentences[sent_index]
+        return str(self.spans[sent_index])
+
+    def is_parsed(self, text: str):
+        return text in self._docs
+
+    def add_doc(self, text: str, doc):
+        self._docs[text] = doc
+
+    def parse(self, text: str):
+        """ Returns: the spacy Doc of `text`, parsing it if it is not cached yet """
+        doc = self._docs.get(text)
+        if doc is None:
+            doc = self._docs[text] = self.nlp_model(text)
+        return doc
+
+    def parse_all(self, texts: list, batch_size: int = None):
+        """ Parses the texts that are not cached yet together with `nlp.pipe`.
+            Returns: list of spacy Docs, in the order of `texts`
+        """
+        parse_in_batches([(self, text) for text in texts], self.nlp_model, batch_size)
+        return [self._docs[text] for text in texts]
+
+    def sentence_doc(self, sent_index: int):
+        """ Returns: the spacy Doc of sentence `sent_index` """
+        return self.parse(self.sentence(sent_index))
+
+    def sentence_docs(self, sent_indices: list = None, batch_size: int = None):
+        """ Returns: the spacy Docs of the sentences in `sent_indices` (default: all sentences) """
+        if sent_indices is None:
+            sent_indices = range(len(self.spans))
+        return self.parse_all([self.sentence(sent_index) for sent_index in sent_indices], batch_size)
+
+    @property
+    def quote_indices(self):
+        """ Start and end position of the quote mark pairs of the article (as `get_quote_indices`) """
+        if self._quote_indices is None:
+            self._quote_indices = self.quote_index.pairs()
+        return self._quote_indices
+
+    def sentence_quote_indices(self, sent_index: int):
+        """ Returns: the quote mark pairs of sentence `sent_index`, relative to the sentence (as `get_quote_indices` on
+            its text: a sentence never starts inside a quote, so its pairs are the article's pairs within it)
+        """
+        span = self.spans[sent_index]
+        return self.quote_index.within(span.start, span.end, relative=True)
+
+    @property
+    def sentence_starts(self):
+        """ Character offset of each sentence in the article """
+        if self._sentence_starts is None:
+            self._sentence_starts = [span.start for span in self.spans]
+        return self._sentence_starts
+
+    def sentence_index(self, offset: int):
+        """ Returns: index of the sentence containing the character `offset` of the article """
+        return max(bisect_right(self.sentence_starts, offset) - 1, 0)
+
+    def sentences_text(self, sent_indices: list = None):
+        """ Returns: the text of the sentences in `sent_indices` (default: the whole article) """
+        if sent_indices is None:
+            return self.text
+        return ' '.join(self.sentence(sent_index) for sent_index in sent_indices)
+
+
+def parse_in_batches(requests, nlp_model, batch_size=None):
+    """ Parses texts for one or more articles with a single `nlp.pipe` call and caches each Doc in its context.
+        Texts already cached, or requested twice, are parsed once.
+
+        :param requests: iterable of (ArticleContext, text) tuples
+        :param nlp_model: spacy model
+        :param batch_size: number of texts parsed together (default: the model's batch size)
+    """
+    missing = {}
+    for context, text in requests:
+        if not context.is_parsed(text):
+            missing.setdefault(text, []).append(context)
+    if not missing:
+        return
+
+    for text, doc in zip(missing, nlp_model.pipe(missing, batch_size=batch_size)):
+        for context in missing[text]:
+            context.add_doc(text, doc)
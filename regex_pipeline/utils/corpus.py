@@ -0,0 +1,281 @@
+import gc
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from collections import Counter, deque
+from itertools import islice
+
+from .incremental import IncrementalExtractor
+from .preprocessing import BLOCKED_TRACKING_TAGS, NEWS_PILLAR, has_blocked_tag, html_to_text
+from .regex_quotes import extract_regex_quotes
+from .speakers import article_full_names, royal_index
+
+
+def iter_jsonl(fname):
+    """ Stream the records of a JSON lines file, skipping blank lines.
+        Returns: generator of dicts
+    """
+    with open(fname, 'rt') as fin:
+        for line in fin:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def iter_articles(path, id_key='id', text_key='text'):
+    """ Stream articles from `path`, which is either a JSONL file with one article per line or a directory of
+        `.jsonl` and `.txt` files. A text file is one article and its file name (without extension) is the id.
+        JSONL records without an `id_key` are given '<file name>:<line number>' as their id.
+        Returns: generator of (article_id, text) tuples
+    """
+    if os.path.isdir(path):
+        for fname in sorted(os.listdir(path)):
+            fpath = os.path.join(path, fname)
+            if fname.endswith('.jsonl'):
+                yield from iter_articles(fpath, id_key, text_key)
+            elif fname.endswith('.txt'):
+                with open(fpath, 'rt') as fin:
+                    yield os.path.splitext(fname)[0], fin.read()
+    else:
+        for line_no, article in enumerate(iter_jsonl(path)):
+            yield article.get(id_key, f'{os.path.basename(path)}:{line_no}'), article[text_key]
+
+
+########################################################
+## CAPI exports
+########################################################
+
+def _jsonl_batches(path, id_key, text_key, batch_size, pillar, blocked_tags):
+    # Batches of the ids and HTML of the kept records, each filtered in a single pass
+    for batch in iter_chunks(iter_jsonl(path), batch_size):
+        kept = [record for record in batch
+                if (pillar is None or record.get('pillar_id') == pillar) and
+                not has_blocked_tag(record.get('tracking_tag'), blocked_tags)]
+        yield [record[id_key] for record in kept], [record[text_key] for record in kept], len(batch)
+
+
+def _blocked_rows(tags, blocked_tags):
+    # Rows of a pyarrow array of tracking tags (lists of tags, or strings) with one of the blocked tags
+    import numpy as np
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    blocked = np.zeros(len(tags), dtype=bool)
+    if pa.types.is_list(tags.type) or pa.types.is_large_list(tags.type):
+        # The tags of all the rows at once, and the row each tag comes from
+        hits = pc.is_in(pc.list_flatten(tags), value_set=pa.array(sorted(blocked_tags), tags.type.value_type))
+        blocked[pc.list_parent_indices(tags).to_numpy()[hits.to_numpy(zero_copy_only=False)]] = True
+    else:
+        for tag in blocked_tags:
+            blocked |= pc.fill_null(pc.match_substring(tags, tag), False).to_numpy(zero_copy_only=False)
+    return blocked
+
+
+def _parquet_batches(path, id_key, text_key, batch_size, pillar, blocked_tags):
+    # Batches of the ids and HTML of the kept rows, each filtered with vectorised operations on its columns
+    try:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Reading Parquet files needs the pyarrow package (pip install pyarrow)")
+    import numpy as np
+
+    parquet_file = pq.ParquetFile(path)
+    names = parquet_file.schema_arrow.names
+    filter_columns = [name for name in ('pillar_id', 'tracking_tag') if name in names]
+    for batch in parquet_file.iter_batches(batch_size, columns=[id_key, text_key] + filter_columns):
+        keep = np.ones(batch.num_rows, dtype=bool)
+        if 'tracking_tag' in names:
+            keep &= ~_blocked_rows(batch.column('tracking_tag'), blocked_tags)
+        if pillar is not None:
+            keep &= (pc.fill_null(pc.equal(batch.column('pillar_id'), pillar), False).to_numpy(zero_copy_only=False)
+                     if 'pillar_id' in names else False)
+        kept = batch.filter(pa.array(keep))
+        yield kept.column(id_key).to_pylist(), kept.column(text_key).to_pylist(), batch.num_rows
+
+
+def iter_capi_articles(path, id_key='id', text_key='text', batch_size=1000, pillar=NEWS_PILLAR,
+                       blocked_tags=BLOCKED_TRACKING_TAGS):
+    """ Stream the articles of a CAPI export, a JSONL or Parquet (`.parquet`) file or a directory of them, whose
+        `text_key` field is the HTML of the article. The records are read in batches of `batch_size` and every batch is
+        filtered at once (for Parquet, with vectorised operations on its columns) to the articles of the `pillar`
+        (`pillar_id` field, None to keep every pillar) without any of the `blocked_tags` in their `tracking_tag` field
+        (see `filter_certain_tags`). The HTML of the articles kept is turned into text with `html_to_text`, so the
+        export is never held in memory.
+        Returns: generator of (article_id, text) tuples
+    """
+    if os.path.isdir(path):
+        for fname in sorted(os.listdir(path)):
+            if fname.endswith(('.jsonl', '.parquet')):
+                yield from iter_capi_articles(os.path.join(path, fname), id_key, text_key, batch_size, pillar,
+                                              blocked_tags)
+        return
+
+    batches = _parquet_batches if path.endswith('.parquet') else _jsonl_batches
+    n_read = n_kept = 0
+    for article_ids, htmls, n_records in batches(path, id_key, text_key, batch_size, pillar, frozenset(blocked_tags)):
+        n_read += n_records
+        n_kept += len(article_ids)
+        for article_id, html in zip(article_ids, htmls):
+            yield article_id, html_to_text(html)[0]
+    logging.info(f"{n_kept} of {n_read} articles of {path} kept by the pillar and tag filters")
+
+
+def extract_corpus(articles, nlp_model, debug=False, mode='full', offsets=False, incremental=None, speaker_ids=False,
+                   **options):
+    """ Run the quote extraction over a stream of articles with an already loaded spacy model.
+        An article that fails is logged and yielded with an empty quote list so the rest of the corpus still runs.
+        In 'regex_only' mode the spacy-free engine `extract_regex_quotes` is used and spacy is never imported.
+
+        :param articles: iterable of (article_id, text) tuples, e.g. from `iter_articles`
+        :param nlp_model: spacy model (None in 'regex_only' mode)
+        :param mode: stages of `extract_quotes_and_sentence_speaker` to run, one of MODES
+        :param offsets: add the offsets of each quote text in the article to its dict ("start" and "end")
+        :param incremental: mapping of article id -> state of its previous version (e.g. a `shelve`). An article seen
+                            before is only extracted again where its paragraphs changed (see `IncrementalExtractor`).
+        :param speaker_ids: add the canonical id of the speaker of each quote to its dict ("speaker_id", None when it is
+                            not resolved), looked up in the index of the royals, the peers of the article and the full
+                            names among its speakers (see `SpeakerAliasIndex`)
+        :param options: other keyword arguments of the extraction (e.g. matcher, window, batch_size, guard)
+
+        returns: generator of (article_id, list of quote dicts, status) tuples, in input order. status is None, or
+                 with a RegexGuard in `options` and an article that was cut or timed out, the guard's `status()`
+    """
+    guard = options.get('guard')
+    if mode == 'regex_only':
+        extract = lambda text, unique=True: extract_regex_quotes(text, debug, unique=unique, **options)
+    else:
+        from .quote_extraction import extract_quotes_and_sentence_speaker
+        extract = lambda text, unique=True: extract_quotes_and_sentence_speaker(text, nlp_model, debug, mode=mode,
+                                                                                unique=unique, **options)
+    incremental_extractor = IncrementalExtractor(extract, incremental) if incremental is not None else None
+
+    for article_id, text in articles:
+        status = None
+        try:
+            if incremental_extractor is not None:
+                quotes = incremental_extractor.update(article_id, text)
+            else:
+                quotes, _ = extract(text)
+            status = guard.status() if guard is not None else None
+        except Exception:
+            logging.exception(f"Quote extraction failed for article '{article_id}'")
+            quotes = []
+        if status is not None:
+            logging.warning(f"Regular expressions cut short for article '{article_id}': {status}")
+        records = [quote_to_dict(quote, offsets) for quote in quotes]
+        if speaker_ids and records:
+            speaker_index = royal_index().for_article(text, article_full_names(quote.speaker for quote in quotes))
+            for record in records:
+                record["speaker_id"] = speaker_index.resolve(record["speaker"])
+        yield article_id, records, status
+    if incremental_extractor is not None:
+        incremental_extractor.log_stats()
+
+
+def quote_to_dict(quote, offsets=False):
+    """ Returns: `quote.to_dict()`, with the "start" and "end" offsets of the quote text if `offsets` """
+    record = quote.to_dict()
+    if offsets:
+        record["start"] = quote.start
+        record["end"] = quote.end
+    return record
+
+
+########################################################
+## Multi-core execution
+########################################################
+
+# Set in the parent before the pool is forked so that the workers share the loaded model copy-on-write
+_worker_nlp = None
+
+
+def _init_worker():
+    # torch defaults to one intra-op thread per core, which oversubscribes the machine once every worker parses
+    if 'torch' in sys.modules:
+        sys.modules['torch'].set_num_threads(1)
+
+
+def _extract_chunk(chunk, debug=False, mode='full', options=None):
+    """ Worker side of `extract_corpus_parallel`: extracts a chunk of articles with the inherited model.
+        Returns: (worker pid, seconds spent, list of (article_id, list of quote dicts, status) tuples, the counters of
+                 the chunk's RegexGuard or None)
+    """
+    options = options or {}
+    guard = options.get('guard')
+    if guard is not None:
+        # The guard is a copy sent with the chunk: count this chunk only and let the parent add it up
+        guard.counters = Counter()
+    start = time.perf_counter()
+    results = list(extract_corpus(chunk, _worker_nlp, debug, mode, **options))
+    return os.getpid(), time.perf_counter() - start, results, guard.counters if guard is not None else None
+
+
+def iter_chunks(iterable, chunk_size):
+    """ Split `iterable` into lists of `chunk_size` items (the last one may be shorter).
+        Returns: generator of lists
+    """
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, chunk_size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, chunk_size))
+
+
+def extract_corpus_parallel(articles, nlp_model, n_workers=None, chunk_size=20, debug=False, mode='full',
+                            **options):
+    """ Multi-process version of `extract_corpus`.
+        The model loaded in the parent is inherited by forked workers, so its memory pages are shared
+        copy-on-write instead of every worker loading its own copy. Articles are sent to the workers in chunks of
+        `chunk_size` and at most two chunks per worker are in flight, so the input is still streamed. Results are
+        yielded in input order and the throughput of every worker is logged at the end.
+
+        :param articles: iterable of (article_id, text) tuples, e.g. from `iter_articles`
+        :param nlp_model: spacy model (None in 'regex_only' mode)
+        :param n_workers: number of worker processes (default: number of CPUs)
+        :param mode: stages of `extract_quotes_and_sentence_speaker` to run, one of MODES
+        :param options: `offsets` and `speaker_ids` (see `extract_corpus`) and the other keyword arguments of the
+                        extraction (e.g. matcher, window, batch_size, guard). The counters of a RegexGuard are added up
+                        over the workers.
+
+        returns: generator of (article_id, list of quote dicts, status) tuples, in input order (see `extract_corpus`)
+    """
+    global _worker_nlp
+    _worker_nlp = nlp_model
+    # Move everything allocated so far out of the garbage collector's reach: the collector writing to the objects'
+    # headers in the workers would otherwise copy the model pages one by one
+    gc.freeze()
+
+    n_workers = n_workers or os.cpu_count()
+    worker_stats = {}
+    context = multiprocessing.get_context('fork')
+    try:
+        with context.Pool(n_workers, initializer=_init_worker) as pool:
+            pending = deque()
+            chunks = iter_chunks(articles, chunk_size)
+            for chunk in chunks:
+                pending.append(pool.apply_async(_extract_chunk, (chunk, debug, mode, options)))
+                if len(pending) >= 2 * n_workers:
+                    break
+
+            while pending:
+                pid, elapsed, results, guard_counters = pending.popleft().get()
+                if guard_counters is not None:
+                    options['guard'].counters.update(guard_counters)
+                n_articles, busy = worker_stats.get(pid, (0, 0.0))
+                worker_stats[pid] = (n_articles + len(results), busy + elapsed)
+                next_chunk = next(chunks, None)
+                if next_chunk is not None:
+                    pending.append(pool.apply_async(_extract_chunk, (next_chunk, debug, mode, options)))
+                yield from results
+    finally:
+        # Once the pool is closed, hand the objects of this process back to the collector
+        gc.unfreeze()
+
+    for pid, (n_articles, busy) in sorted(worker_stats.items()):
+        logging.info(f"Worker {pid}: {n_articles} articles in {busy:.1f}s "
+                     f"({n_articles / busy if busy else 0.0:.2f} articles/s)")
@@ -1,41 +1,31 @@
-import spacy
-
-from functools import reduce
-from itertools import groupby
-import requests, json
 import re
 
-from spacy.language import Language
-
-from .preprocessing import sentencise_text, open_quote_mark, close_quote_mark
+from .preprocessing import open_quote_mark, close_quote_mark
 
 
-def get_person_by_sentence(text, nlp_model):
+def get_person_by_sentence(context):
     person_list = []
-    tokens = nlp_model(text)
-    sentences = [sent.text.strip() for sent in tokens.sents]
-    for sent in sentences:
-        all_tags = nlp_model(sent)
+    for all_tags in context.sentence_docs():
         for ent in all_tags.ents:
             if ent.label_ == "PERSON":
                 person_list.append(str(ent))
     return person_list
 
 
+# a nobel title and the name following it
+peer_regex = re.compile(r'(Lord|Baroness|Lady|Baron)\s+([A-Za-z]+(?:-[A-Za-z]+)?)')
+peer_exceptions = frozenset(['Lord Lieutenant', 'Lord Justice Sir', 'Lord Chief Justice'])
+
+
 def get_life_peers(text):
-    # find a nobel title and grab it with the following name
-    names = re.compile(r'(Lord|Baroness|Lady|Baron)\s+([A-Za-z]+(?:-[A-Za-z]+)?)')
-    names_with_titles = names.findall(text)
-    life_peers = list(set(names_with_titles))
-    empty_free = [(tuple(int(x) if x.isdigit() else x for x in _ if x)) for _ in life_peers]
-    # remove duplicates based on the last index in tuples
-    dupl_free = [max(reversed(list(v)), key=len) for k, v in groupby(empty_free, lambda x: x[0])]
-    life_peers = list(set([' '.join(map(str, peer)) for peer in dupl_free]))
-    peers_names = [name.rstrip() for name in life_peers]
-    # filter for exceptions
-    peers_names = [name for name in peers_names if
-                   name not in ['Lord Lieutenant', 'Lord Justice Sir', 'Lord Chief Justice']]
-    return peers_names
+    """ Returns: the peers of `text` (title and name, e.g. 'Lord Smith') without duplicates, in the order they first
+        appear, without the exceptions """
+    peers_names = {}
+    for title, name in peer_regex.findall(text):
+        peer = title + ' ' + name
+        if peer not in peer_exceptions:
+            peers_names[peer] = None
+    return list(peers_names)
 
 
 ############################################################################################################
@@ -81,137 +71,167 @@ royal_dict = {'The Queen': ['The Queen', 'Elizabeth II', 'Princess Elizabeth', '
                                       'Crown Prince']}
 
 
+class NameNormaliser:
+    """ The cleaning of the PERSON entities of an article (see `cleaning_names`) with its word lists compiled once: the
+        removed titles are only replaced in a name where one of them is found by a single regex, the lower-cased drop
+        and remove lists are sets and every regex is compiled. A name is cleaned on its own in one pass, and the names
+        that repeat in an article are only cleaned once; the rest of the rules are set lookups over the cleaned names.
+
+        :param replace: the parts removed from every name (e.g. titles), in the order they are removed
+        :param drop: the words that leave out the names they are in
+        :param remove: the names left out
+    """
+    twitter_pic_regex = re.compile(r'[^\s]*pic.twitter.com[^\s]*')
+    digit_regex = re.compile(r'\d')
+    hyphen_regex = re.compile(r'(\ - .*$)')
+    email_regex = re.compile(r'[^\s]*@[^\s]*')
+    possessive_end_regex = re.compile(r"'s$|'$")
+    al_regex = re.compile(r'(al-)|(Al-)')
+    # Two capitals in a word: abbreviations (BBC, MoJ) unless it is a Scottish or Irish name (McDonald)
+    abbreviation_regex = re.compile(r'[A-Z]\w*[A-Z]')
+    mac_regex = re.compile(r'(Mc[A-Z]|Mac[A-Z])')
+
+    def __init__(self, replace, drop, remove):
+        self.replace = tuple(replace)
+        self.replace_regex = re.compile('|'.join(re.escape(part) for part in self.replace))
+        self.drop = frozenset(word.lower() for word in drop)
+        self.remove = frozenset(name.lower() for name in remove)
+        self._cache = {}
+
+    def clean_name(self, name):
+        """ Applies the rules that look at one name at a time.
+            Returns: tuple of the names it gives (none, or several if spacy grabbed them together)
+        """
+        cleaned = self._cache.get(name)
+        if cleaned is None:
+            cleaned = self._cache[name] = tuple(self._clean_name(name))
+            if len(self._cache) > 100000:
+                self._cache.clear()
+                self._cache[name] = cleaned
+        return cleaned
+
+    def _clean_name(self, name):
+        name = self.twitter_pic_regex.sub('', name)
+        if self.replace_regex.search(name):
+            # In order, as removing a part can bring the letters around it together
+            for part in self.replace:
+                name = name.replace(part, '')
+        if (self.digit_regex.search(name) or name.islower() or name.isupper() or
+                name.lower().startswith('the ')):
+            return
+        # Words after '. ' when it grabs the beginning of the next sentence, and names separated by commas
+        for name in name.split('. ', 1)[0].split(', '):
+            name = self.hyphen_regex.sub('', name)
+            name = self.email_regex.sub('', name)
+            if '&' in name:
+                continue
+            name = name.split("'s ", 1)[-1]
+            name = self.possessive_end_regex.sub('', name)
+            name = name.replace('— ', '').replace(' (', '').replace('+', '')
+            if name.endswith(' -'):
+                name = name[:-2]
+            name = self.al_regex.sub('', name)
+            if self.abbreviation_regex.search(name) and not self.mac_regex.search(name):
+                continue
+            if name:
+                yield name
+
+    def clean(self, names):
+        """ Returns: the names of the article without duplicates and the surnames and first names they contain (see
+            `cleaning_names`)
+        """
+        no_empty = [cleaned for name in names for cleaned in self.clean_name(name)]
+
+        # set to lower then back to capwords - Kim Jong-Un == Kim Jong-un
+        no_empty_set = set(no_empty)
+        names_cap = [name for name in no_empty if name.istitle() or name.title() not in no_empty_set]
+        names_unique = list(set(names_cap))
+        clean_names = [name for name in names_unique if name.lower() not in self.remove]
+
+        # check surnames against full names
+        words = [name.split(' ') for name in clean_names]
+        lonely_names = [name for name in clean_names if ' ' not in name]
+        # common in English where the surname is only the third name and the second shouldn't be included.
+        double_surnames = set()
+        first_double_surnames = set()
+        second_double_surnames = []
+        for name, parts in zip(clean_names, words):
+            if len(parts) == 3:
+                double_surnames.add(parts[1] + ' ' + parts[2])
+                first_double_surnames.add(parts[1])
+                second_double_surnames.append(parts[2])
+        second_double_surnames_set = set(second_double_surnames)
+
+        first_names = [parts[0] for parts in words if len(parts) > 1 and parts[0] not in first_double_surnames]
+        surnames = [parts[1] for parts in words if len(parts) == 2 and parts[1] not in second_double_surnames_set]
+        surnames += second_double_surnames
+
+        full_names = [(name, parts) for name, parts in zip(clean_names, words)
+                      if len(parts) > 1 and name not in double_surnames]
+        # Rule Osama Laden == Osama Bin Laden == Osama Laden
+        full_names = [name for i, (name, parts) in enumerate(full_names)
+                      if i == 0 or parts[0] != full_names[i - 1][1][0] or parts[-1] != full_names[i - 1][1][-1]]
+
+        surnames_set = set(surnames)
+        first_names_set = set(first_names)
+        first_names_duplicatesfree = [name for name in lonely_names
+                                      if name not in surnames_set and name not in first_names_set]
+
+        # drop part of names from the drop list
+        names_drop = [name for name in first_names_duplicatesfree + full_names
+                      if self.drop.isdisjoint(name.lower().split(' '))]
+
+        return names_drop, surnames, first_names_duplicatesfree
+
+
+name_normaliser = NameNormaliser(replace, drop, remove)
+
+
 def cleaning_names(names):
-    # remove twitter pictures
-    twitter_pic_free = [re.sub(r'[^\s]*pic.twitter.com[^\s]*', '', name) for name in names]
-    # remove parts from the replace list
-    names_replace = [reduce(lambda str, e: str.replace(e, ''), replace, name) for name in twitter_pic_free]
-    # remove strings with numbers
-    no_digits = [name for name in names_replace if not re.search(r'\d', name)]
-    # remove string in ALL lower
-    no_lower = [name for name in no_digits if not name.islower()]
-    # remove strings in ALL upper
-    no_upper = [name for name in no_lower if not name.isupper()]
-    # remove strings which start with 'the '
-    no_the = [name for name in no_upper if name not in [name for name in no_upper if name.lower().startswith('the ')]]
-    # remove words afrer '. ' when it grabs the beggining of the next sentence
-    after_stop = [name.split('. ', 1)[0] for name in no_the]
-
-    # split names separated by comma when Spacy grabs them together
-    comma_free = []
-    for name in after_stop:
-        if ', ' not in name:
-            comma_free.append(name)
-        else:
-            for i in range(len(name.split(', '))):
-                comma_free.append(name.split(', ')[i])
-
-    # remove ' - who' etc.
-    no_hyphen = [re.sub(r'(\ - .*$)', '', name) for name in comma_free]
-    # remove email addresses
-    no_email = [re.sub(r'[^\s]*@[^\s]*', '', name) for name in no_hyphen]
-    # remove strings with & char
-    no_special_char = [name for name in no_email if '&' not in name]
-    # remove words before ''s ' when it's not part of the name
-    s_names = [name.split("'s ", 1)[-1] for name in no_special_char]
-    # remove 's and ' at the end of the name
-    names_s = [re.sub(r"'s$|'$", '', name) for name in s_names]
-    # remove long -, (, +
-    no_sintax = [re.sub(r'(\— )', '', name) for name in names_s]
-    no_sintax = [re.sub(r'( \()', '', name) for name in no_sintax]
-    no_sintax = [re.sub(r'(\+)', '', name) for name in no_sintax]
-    # remove - from the end
-    no_end_dash = [name[:-2] if name.endswith(' -') else name for name in no_sintax]
-    # al-Assad == Assad == Al-Assad
-    no_al = [re.sub(r'(al-)|(Al-)', '', name) for name in no_end_dash]
-    # remove BBC, NHS etc. and MoJ etc. but not Smith-Porter
-    no_abr = []
-    for name in no_al:
-        if not re.search(r'(\w*[A-Z]\w*[A-Z]\w*)', name):
-            no_abr.append(name)
-        elif re.search(r'(Mc[A-Z]|Mac[A-Z])', name):
-            no_abr.append(name)
-
-    # remove empty strings
-    no_empty = [i for i in no_abr if len(i) > 0]
-
-    # set to lower then back to capwords - Kim Jong-Un == Kim Jong-un
-    names_cap = [name for name in no_empty if name.istitle() or name.title() not in no_empty]
-    names_unique = list(set(names_cap))
-
-    clean_names = [name for name in names_unique if name.lower() not in [e.lower() for e in remove]]
-
-    # check surnames against full names
-    lonely_names = [name.split(' ')[0] for name in clean_names if ' ' not in name]  # grab lonely(!) names
-
-    double_surnames = [name.split(' ')[-2] + ' ' + name.split(' ')[-1] for name in clean_names \
-                       if ' ' in name and len(name.split(' ')) == 3]
-
-    first_double_surnames = [name.split(' ')[0] for name in double_surnames]
-    second_double_surnames = [name.split(' ')[1] for name in double_surnames]
-
-    first_names = [name.split(' ')[0] for name in clean_names if ' ' in name \
-                   and name.split(' ')[0] not in first_double_surnames]  # grab first names from full names
-    surnames = [name.split(' ')[-1] for name in clean_names if ' ' in name and len(name.split(' ')) == 2 \
-                and name.split(' ')[1] not in second_double_surnames]  # grab last names
-
-    # common in English where the surname is only the third name and the second shouldn't be included.
-    surnames += second_double_surnames
-
-    full_names = [name for name in clean_names if ' ' in name and name not in double_surnames]  # grab full names
-
-    # Rule Osama Laden == Osama Bin Laden == Osama Laden
-    names_to_drop = []
-    for i in range(1, len(full_names)):
-
-        if full_names[i].split(' ')[0] == full_names[i - 1].split(' ')[0] \
-                and full_names[i].split(' ')[-1] == full_names[i - 1].split(' ')[-1]:
-            names_to_drop.append(full_names[i])
-
-    for name in names_to_drop:
-        full_names.remove(name)
-
-    first_names_surnamesfree = []
-    for name in lonely_names:
-        if name not in surnames and name not in second_double_surnames:
-            first_names_surnamesfree.append(name)
-
-    first_names_duplicatesfree = []
-    for name in first_names_surnamesfree:
-        if name not in first_names:
-            first_names_duplicatesfree.append(name)
-
-    names_unique_new = first_names_duplicatesfree + full_names
-
-    # drop part of names from the drop list
-    names_drop = [name for name in names_unique_new if not any(e.lower() in name.lower().split(' ') for e in drop)]
-    # drop names from the removal list
-
-    # list_of_names is a list of all PERSON entities in the article
-    names_dict = {}
-    names_with_middle = []
-    for i in range(1, len(clean_names)):
-        if clean_names[i].split(' ')[0] == clean_names[i - 1].split(' ')[0] \
-                and clean_names[i].split(' ')[-1] == clean_names[i - 1].split(' ')[-1]:
-            names_dict[clean_names[i]] = clean_names[i - 1]
-            names_with_middle.append(clean_names[i])
-
-    return names_drop, surnames, first_names_duplicatesfree
+    """ Cleans the PERSON entities of an article: titles and other parts of the replace list are removed, names that
+        are not people (numbers, abbreviations, the drop and remove lists, ...) are left out, and the full names, first
+        names and surnames are told apart (see NameNormaliser).
+        Returns: list of the names (first names found alone, and full names), list of surnames, list of first names
+                 found alone
+    """
+    return name_normaliser.clean(names)
+
+
+# Characters that make a name's word more than a literal in a regex
+REGEX_SPECIAL_CHARACTERS = frozenset('.^$*+?{}[]\\|()')
+word_regex = re.compile(r'\w+')
 
 
 def remove_duplicate_names(names, other_names):
-    out = []
+    """ Leaves out the names with a word found as a whole word in one of `other_names` (e.g. 'Peter Smith' when 'Lord
+        Smith' is one of the peers), along with the names that are part of such a name (e.g. 'Smith').
+        The words of `other_names` are indexed once, so that a word of a name is a set lookup: a word that is a run of
+        letters and digits is in a name as a whole word when it is one of the runs of that name, and any other word is
+        only searched for with a regex in `other_names` when all its runs are in the index.
+        Returns: list of names
+    """
+    if not other_names:
+        return list(names)
+    other_words = {word for name in other_names for word in word_regex.findall(name)}
+    found = {}
+
+    def is_found(word):
+        if word not in found:
+            if REGEX_SPECIAL_CHARACTERS.isdisjoint(word):
+                runs = word_regex.findall(word)
+                found[word] = all(run in other_words for run in runs) and \
+                    (runs == [word] or any(re.search(r"\b" + word + r"\b", name) for name in other_names))
+            else:
+                found[word] = any(re.search(r"\b" + word + r"\b", name) for name in other_names)
+        return found[word]
+
+    out = set()
     for name in names:
-        names_split = name.split()
-        for i in range(len(names_split) + 1, 0, -1):
-            for n in range(0, len(names_split) + 1 - i):
-                names_join = ' '.join(names_split[n:n + i])
-                for n in names_split:
-                    for name in other_names:
-                        if re.search(r"\b" + n + r"\b", name):
-                            out.append(names_join)
-    clean_names = [name for name in names if name not in out]
-    return clean_names
+        words = name.split()
+        if any([is_found(word) for word in words]):
+            # Every part of the name
+            out.update(' '.join(words[n:n + i]) for i in range(1, len(words) + 1) for n in range(len(words) + 1 - i))
+    return [name for name in names if name not in out]
 
 
 def clean_orgs(org_list):
@@ -224,10 +244,10 @@ def clean_orgs(org_list):
     return clean_org_list
 
 
-def get_people_and_orgs_by_sentence(text, nlp_model):
+def get_people_and_orgs_by_sentence(context, sent_indices=None):
     person_list = []
     org_list = []
-    sentences = [nlp_model(sent) for sent in sentencise_text(text)]
+    sentences = context.sentence_docs(sent_indices)
     for sent in sentences:
         for ent in sent.ents:
             if ent.label_ == "PERSON":
@@ -239,8 +259,9 @@ def get_people_and_orgs_by_sentence(text, nlp_model):
     return person_list, cleaned_orgs, sentences
 
 
-def get_complete_ents_list(text, nlp_model):
-    """ Gets a complete list of entities in a text using a spacy model
+def get_complete_ents_list(context, sent_indices=None):
+    """ Gets a complete list of entities in the sentences `sent_indices` (default: all) of an article using the
+       spacy model and the cached sentence Docs of its ArticleContext
 
        Returns:
            a cleaned list of full_names, surnames, lonely_names (names that only appear as a single word, not
@@ -248,8 +269,8 @@ def get_complete_ents_list(text, nlp_model):
            times.
        """
 
-    names, orgs, sents = get_people_and_orgs_by_sentence(text, nlp_model)
-    peers_names = get_life_peers(text)
+    names, orgs, sents = get_people_and_orgs_by_sentence(context, sent_indices)
+    peers_names = get_life_peers(context.sentences_text(sent_indices))
 
     clean_names_all, surnames, lonely_names = cleaning_names(names)
     clean_names = remove_duplicate_names(clean_names_all, peers_names)
@@ -0,0 +1,146 @@
+import logging
+import signal
+import threading
+import time
+from collections import Counter, namedtuple
+from contextlib import contextmanager
+
+
+########################################################
+## Guarded regex engine
+## Bounds the time the regular expressions spend on one article, so a pathological article (e.g. a long liveblog
+## with unbalanced quote marks) cannot stall a worker
+########################################################
+
+# What happened to one article: the patterns that ran out of time, the patterns skipped because the article had
+# run out of time, whether the text was cut to the length cap and the seconds spent in the patterns
+GuardReport = namedtuple('GuardReport', ['timed_out', 'skipped', 'truncated', 'elapsed'])
+
+
+class RegexTimeout(Exception):
+    pass
+
+
+def _raise_timeout(signum, frame):
+    raise RegexTimeout()
+
+
+def can_interrupt():
+    """ A running regex can only be interrupted by SIGALRM, which is only available on Unix and only delivered to the
+        main thread.
+        Returns: bool
+    """
+    return hasattr(signal, 'setitimer') and threading.current_thread() is threading.main_thread()
+
+
+@contextmanager
+def deadline(seconds):
+    """ Raises RegexTimeout in the block if it runs for more than `seconds`. The regex engine checks for signals while
+        it matches, so this also stops a single catastrophic match. Does nothing where `can_interrupt` is False.
+    """
+    if seconds is None or not can_interrupt():
+        yield
+        return
+    previous_handler = signal.signal(signal.SIGALRM, _raise_timeout)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous_handler)
+
+
+class RegexGuard:
+    """ Time budgets and a length cap for the regular expressions run on each article.
+        `start` is called once per article and every pattern is then run through `run`: a pattern that takes more
+        than `pattern_budget` seconds is stopped and gives no matches, and once the article has used `article_budget`
+        seconds the remaining patterns are skipped. Texts longer than `max_length` characters are cut to their
+        paragraphs within the cap.
+        `report` describes the last article and `counters` add up over every article seen by this guard (in this
+        process). None disables a limit.
+
+        :param pattern_budget: seconds one pattern may run on an article
+        :param article_budget: seconds all the patterns may run on an article
+        :param max_length: number of characters of an article that are processed
+    """
+    def __init__(self, pattern_budget: float = 1.0, article_budget: float = 5.0, max_length: int = 500000):
+        self.pattern_budget = pattern_budget
+        self.article_budget = article_budget
+        self.max_length = max_length
+        self.counters = Counter()
+        self._timed_out = []
+        self._skipped = []
+        self._truncated = False
+        self._elapsed = 0.0
+        if not can_interrupt():
+            logging.warning('Regex time budgets are only checked after each pattern outside the main thread on Unix')
+
+    def start(self, text: str):
+        """ Starts the budgets of a new article.
+            Returns: the text to process, cut to `max_length` if needed
+        """
+        self._timed_out = []
+        self._skipped = []
+        self._truncated = False
+        self._elapsed = 0.0
+        self.counters['articles'] += 1
+        if self.max_length is not None and len(text) > self.max_length:
+            # Cut at the last paragraph break within the cap so no sentence is split
+            cut = text.rfind('\n', 0, self.max_length)
+            text = text[:cut if cut > 0 else self.max_length]
+            self._truncated = True
+            self.counters['truncated'] += 1
+        return text
+
+    def remaining(self):
+        """ Returns: seconds left for the next pattern (None if unlimited) """
+        budgets = [budget for budget in (self.pattern_budget,
+                                         None if self.article_budget is None else self.article_budget - self._elapsed)
+                   if budget is not None]
+        return min(budgets) if budgets else None
+
+    def run(self, name: str, function, *args):
+        """ Runs `function(*args)`, a regex stage named `name`, within the budgets.
+            Returns: the result of the function, or an empty list if it timed out or was skipped
+        """
+        budget = self.remaining()
+        if budget is not None and budget <= 0:
+            self._skipped.append(name)
+            self.counters['skipped_patterns'] += 1
+            return []
+
+        start = time.perf_counter()
+        timed_out = False
+        try:
+            with deadline(budget):
+                result = function(*args)
+        except RegexTimeout:
+            timed_out = True
+        elapsed = time.perf_counter() - start
+        self._elapsed += elapsed
+        # Without a signal the budget is only checked once the pattern is done, but its matches are dropped the same
+        if timed_out or (budget is not None and elapsed > budget):
+            if not self._timed_out:
+                self.counters['timed_out_articles'] += 1
+            self._timed_out.append(name)
+            self.counters['pattern_timeouts'] += 1
+            self.counters[f'timeout:{name}'] += 1
+            return []
+        return result
+
+    @property
+    def report(self):
+        return GuardReport(tuple(self._timed_out), tuple(self._skipped), self._truncated, self._elapsed)
+
+    def status(self):
+        """ Returns: dict describing what the guard changed in the last article, or None if it was fully processed """
+        report = self.report
+        if not (report.timed_out or report.skipped or report.truncated):
+            return None
+        return {'timed_out': list(report.timed_out), 'skipped': list(report.skipped), 'truncated': report.truncated}
+
+    def log_stats(self):
+        counters = self.counters
+        logging.info(f"Regex guard: {counters['timed_out_articles']} of {counters['articles']} articles timed out "
+                     f"({counters['pattern_timeouts']} patterns, {counters['skipped_patterns']} skipped), "
+                     f"{counters['truncated']} truncated")
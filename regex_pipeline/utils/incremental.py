@@ -0,0 +1,220 @@
+import hashlib
+import json
+import logging
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from difflib import SequenceMatcher
+
+from .classes import Quote
+from .patterns import QUOTE_TYPES
+from .preprocessing import QuoteIndex
+
+
+########################################################
+## Paragraph-level incremental extraction
+########################################################
+
+def paragraph_hash(paragraph: str):
+    return hashlib.sha1(paragraph.encode('utf8')).hexdigest()
+
+
+def paragraph_blocks(text: str):
+    """ Splits `text` into paragraphs (at the new lines) and groups them into blocks that can be extracted on their own:
+        a block only ends at a new line where no quote is open, since a quote running over several paragraphs (and the
+        sentence it is in) has to be seen whole. Blocks are separated by one new line.
+        Returns: list of paragraph hashes, list of [first paragraph, end paragraph (excluded), start offset, end offset]
+    """
+    quote_index = QuoteIndex.from_text(text)
+    starts, ends, unclosed_start = quote_index.starts, quote_index.ends, quote_index.unclosed_start
+    hashes = []
+    blocks = []
+    block_start = 0
+    first_paragraph = 0
+    paragraph_start = 0
+    while True:
+        paragraph_end = text.find('\n', paragraph_start)
+        if paragraph_end == -1:
+            paragraph_end = len(text)
+        hashes.append(paragraph_hash(text[paragraph_start:paragraph_end]))
+        if paragraph_end == len(text):
+            break
+        # The first quote that ends after the new line must also start after it, and no quote may be left open before
+        quote = bisect_left(ends, paragraph_end)
+        if ((quote == len(ends) or starts[quote] > paragraph_end) and
+                (unclosed_start is None or unclosed_start > paragraph_end)):
+            blocks.append([first_paragraph, len(hashes), block_start, paragraph_end])
+            first_paragraph = len(hashes)
+            block_start = paragraph_end + 1
+        paragraph_start = paragraph_end + 1
+    blocks.append([first_paragraph, len(hashes), block_start, len(text)])
+    return hashes, blocks
+
+
+def _quote_record(quote, shift: int = 0):
+    record = quote.to_dict()
+    record['start'] = quote.start + shift
+    record['end'] = quote.end + shift
+    return record
+
+
+def _records_key(records: list):
+    # The quote records of a block, whatever their order
+    return sorted(json.dumps(record, sort_keys=True) for record in records)
+
+
+def _quote_from_record(record: dict):
+    record = dict(record)
+    quote_type = record.pop('QUOTE_TYPE')
+    quote = Quote(**record)
+    quote.QUOTE_TYPE = quote_type
+    return quote
+
+
+def merge_quotes(quotes):
+    """ Removes the duplicates as `extract_quotes_and_sentence_speaker` does, separately for the whole-text regex
+        quotes and the 'adding' quotes, and keeps every orphan quote. The quotes are put back in the order in which the
+        patterns found them (by pattern, then position), so that of two equal quotes the same one is kept.
+        Returns: list of Quote
+    """
+    quotes = sorted(quotes, key=lambda quote: (quote.QUOTE_TYPE, quote.start))
+    adding, orphan = QUOTE_TYPES['someone_said_adding_colon'], QUOTE_TYPES['orphan']
+    regex_quotes = [quote for quote in quotes if quote.QUOTE_TYPE not in (adding, orphan)]
+    adding_quotes = [quote for quote in quotes if quote.QUOTE_TYPE == adding]
+    orphan_quotes = [quote for quote in quotes if quote.QUOTE_TYPE == orphan]
+    return list(set(regex_quotes)) + list(set(adding_quotes)) + orphan_quotes
+
+
+class IncrementalExtractor:
+    """ Re-extracts an updated article (e.g. a liveblog republished with a few paragraphs changed) from its changed
+        paragraphs only, reusing the quotes found in the previous version for the rest.
+        The state of every article is its paragraph hashes and its blocks (see `paragraph_blocks`), each with the quotes
+        that start in it. A new version is diffed against the previous one on the paragraph hashes: a block made of the
+        same paragraphs as a previous block gets that block's quotes, moved to its new offset, and the other blocks are
+        extracted again together with `neighbours` blocks on each side, since an orphan quote is attributed from the
+        sentence before it and a regex can match across a paragraph break. When a neighbour does not give the quotes of
+        its previous version, a match from further away runs into it and the extraction is widened on that side (see
+        `_extract_run`). The first version of an article is extracted whole.
+
+        :param extract: the extraction function, taking a text and `unique` and returning (list of Quote, list of
+                        matched sentences), e.g. `extract_quotes_and_sentence_speaker` with its model and options
+        :param store: mapping of article id (str) -> state (dict by default; a `shelve` keeps it between runs)
+        :param neighbours: blocks re-extracted on each side of a changed block
+    """
+    def __init__(self, extract, store=None, neighbours: int = 1):
+        self.extract = extract
+        self.store = store if store is not None else {}
+        self.neighbours = neighbours
+        self.counters = Counter()
+
+    def _extract(self, text: str, blocks: list, first: int, last: int):
+        # Extracts blocks first..last-1 together and files their quotes under the block they start in. A quote is filed
+        # by its first character that is not white space: a quote text can start on the new line between two blocks
+        # (e.g. an 'adding' quote, whose sentence does), and it depends on the block after it
+        start = blocks[first][2]
+        quotes, _ = self.extract(text[start:blocks[last - 1][3]], unique=False)
+        block_starts = [block[2] for block in blocks[first:last]]
+        run_quotes = [[] for _ in range(first, last)]
+        for quote in quotes:
+            quote_text = quote.quote_text or ''
+            first_character = quote.start + start + len(quote_text) - len(quote_text.lstrip())
+            run_quotes[bisect_right(block_starts, first_character) - 1].append(_quote_record(quote, start))
+        return run_quotes
+
+    def _extract_run(self, text: str, blocks: list, first: int, last: int, keep, reused_quotes: dict):
+        # Extracts the run of blocks first..last-1, whose blocks in `keep` are extracted again and the others only there
+        # as context, and returns the first block and the quotes of the run. The regexes match from left to right, so a
+        # match starting before the run can take up the text the run starts with (and a match in the run can go on
+        # after it): when a context block at an end of the run does not give the quotes of its previous version, the
+        # run is widened on that side
+        while True:
+            run_quotes = self._extract(text, blocks, first, last)
+            widen_first = (first > 0 and first not in keep and
+                           _records_key(run_quotes[0]) != _records_key(reused_quotes[first]))
+            widen_last = (last < len(blocks) and last - 1 not in keep and
+                          _records_key(run_quotes[-1]) != _records_key(reused_quotes[last - 1]))
+            if not (widen_first or widen_last):
+                return first, run_quotes
+            self.counters['runs_widened'] += 1
+            first -= widen_first
+            last += widen_last
+
+    def _around(self, blocks, n_blocks: int):
+        # The blocks and their neighbours
+        around = set()
+        for i in blocks:
+            around.update(range(max(i - self.neighbours, 0), min(i + self.neighbours + 1, n_blocks)))
+        return around
+
+    def update(self, article_id, text: str):
+        """ Extracts the quotes of the latest version of an article and keeps its state for the next version.
+            Returns: list of Quote
+        """
+        key = str(article_id)
+        hashes, blocks = paragraph_blocks(text)
+        block_quotes = [[] for _ in blocks]
+        previous = self.store.get(key)
+
+        if previous is None:
+            block_quotes = self._extract(text, blocks, 0, len(blocks))
+            self.counters['paragraphs_extracted'] += len(hashes)
+        else:
+            # Previous paragraph of each paragraph that is unchanged, by diffing the paragraph hashes
+            old_paragraph = {}
+            matcher = SequenceMatcher(None, previous['paragraphs'], hashes, autojunk=False)
+            for old_first, new_first, size in matcher.get_matching_blocks():
+                for i in range(size):
+                    old_paragraph[new_first + i] = old_first + i
+            old_blocks = {(block[0], block[1]): j for j, block in enumerate(previous['blocks'])}
+
+            # Previous block of each block made of the same paragraphs
+            reused = {}
+            for i, (first, end, _, _) in enumerate(blocks):
+                old_first = old_paragraph.get(first)
+                if old_first is None or (old_first, old_first + end - first) not in old_blocks:
+                    continue
+                if all(old_paragraph.get(paragraph) == old_first + paragraph - first for paragraph in range(first, end)):
+                    reused[i] = old_blocks[(old_first, old_first + end - first)]
+            # A block also counts as changed when a block was added or removed next to it
+            n_old = len(previous['blocks'])
+            changed = [i for i in range(len(blocks))
+                       if i not in reused or
+                       reused.get(i - 1, -1 if i == 0 else None) != reused[i] - 1 or
+                       reused.get(i + 1, n_old if i == len(blocks) - 1 else None) != reused[i] + 1]
+            # The quotes of the changed blocks and of their neighbours are found again, and those neighbours are
+            # themselves extracted with their own neighbours, which are only there as context
+            to_extract = self._around(changed, len(blocks))
+            in_run = self._around(to_extract, len(blocks))
+
+            reused_quotes = {}
+            for i, j in reused.items():
+                old_block = previous['blocks'][j]
+                shift = blocks[i][2] - old_block[2]
+                reused_quotes[i] = [dict(record, start=record['start'] + shift, end=record['end'] + shift)
+                                    for record in old_block[4]]
+                if i not in to_extract:
+                    block_quotes[i] = reused_quotes[i]
+                    self.counters['paragraphs_reused'] += blocks[i][1] - blocks[i][0]
+            self.counters['paragraphs_extracted'] += sum(blocks[i][1] - blocks[i][0] for i in to_extract)
+            # Runs of consecutive blocks are extracted together
+            run_first = None
+            for i in range(len(blocks) + 1):
+                if i < len(blocks) and i in in_run:
+                    if run_first is None:
+                        run_first = i
+                elif run_first is not None:
+                    run_first, run_quotes = self._extract_run(text, blocks, run_first, i, to_extract, reused_quotes)
+                    for block, quotes in enumerate(run_quotes, run_first):
+                        if block in to_extract:
+                            block_quotes[block] = quotes
+                    run_first = None
+
+        self.store[key] = {'paragraphs': hashes,
+                           'blocks': [block + [quotes] for block, quotes in zip(blocks, block_quotes)]}
+        self.counters['articles'] += 1
+        return merge_quotes([_quote_from_record(record) for quotes in block_quotes for record in quotes])
+
+    def log_stats(self):
+        extracted, reused = self.counters['paragraphs_extracted'], self.counters['paragraphs_reused']
+        if extracted + reused:
+            logging.info(f"Incremental extraction: {reused} of {extracted + reused} paragraphs reused "
+                         f"({reused / (extracted + reused):.0%}) over {self.counters['articles']} articles")
@@ -0,0 +1,42 @@
+########################################################
+## Cue lexicon: the quote verbs, compiled once for the regexes and the dependency attribution
+########################################################
+
+# The forms used by the regexes: past tense, gerund and third person (e.g. 'said', 'saying', 'says')
+REGEX_FORM_ENDINGS = ('d', 'g', 's')
+
+
+class CueLexicon:
+    """ The cue (quote verb) list compiled once: a frozen set of its forms, which the dependency attribution tests the
+        token texts against, and the regex alternation used by the patterns.
+
+        :param words: the cues, in the order of the list they come from
+    """
+    def __init__(self, words):
+        self.words = tuple(dict.fromkeys(word for word in words if word))
+        self.forms = frozenset(self.words)
+
+    @classmethod
+    def from_file(cls, path: str):
+        """ Returns: CueLexicon of a file with one cue per line """
+        with open(path, 'r') as f:
+            return cls([line.strip() for line in f])
+
+    def __contains__(self, word: str):
+        return word in self.forms
+
+    def __iter__(self):
+        return iter(self.words)
+
+    def __len__(self):
+        return len(self.words)
+
+    def regex_forms(self):
+        """ Returns: list of the cues used by the regexes, in list order """
+        return [word for word in self.words if word.endswith(REGEX_FORM_ENDINGS)]
+
+    def alternation(self):
+        """ Returns: the regex alternation of `regex_forms` ('said|says|...'). The order of the list is kept, since the
+            first alternative that lets a pattern match is the one that is used.
+        """
+        return '|'.join(self.regex_forms())
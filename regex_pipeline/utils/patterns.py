@@ -0,0 +1,72 @@
+########################################################
+## Regex definitions and quote verb list
+## The quote verb list is package data read on first use, and the patterns that contain the quote verbs are only
+## built then (see `__getattr__`), so importing this module is cheap and works from any working directory
+########################################################
+
+import pkgutil
+from functools import lru_cache
+
+from .lexicon import CueLexicon
+
+# The patterns containing the quote verbs, with '{cue_verbs}' in their place
+PATTERN_TEMPLATES = {
+    're_quote_someone_said':
+        r'(“[^“\n]+?[,?!]”) ([^\.!?]+?)[\n ]({cue_verbs})([^\.!?]*?)[\.,][\n ]{{0,2}}(“[\w\W]+?”){{0,1}}',
+    're_quote_said_someone': '(“[^“\n]+?[,?!]”)[\n ]({cue_verbs}) ([^\.!?]+?)[\.,](\s{{0,2}}“[^”]+?”){{0,1}}',
+    're_quote_someone_told_someone':
+        '(“[^“\n]+?[,?!]”)[\n ]([^\.!?]*?) ({cue_verbs}) ([^\.!?]*?)[\.,][\n ]{{0,2}}(“[\w\W]+?”){{0,1}}',
+    're_quote_someone_said_colon': '([^“\n]+?) ({cue_verbs})( \w*?){{0,5}}: (“[\w\W]+?”){{1,1}}',
+    # re_quote_someone_said_colon up to the opening quote mark: a line can only contain a match if this matches in it
+    're_quote_someone_said_colon_head': '([^“\n]+?) ({cue_verbs})( \w*?){{0,5}}: “',
+}
+# The module attributes computed on first access
+LAZY_NAMES = frozenset(['cue_lexicon', 'quote_verbs', 'quote_verb_boolean_string', *PATTERN_TEMPLATES])
+
+
+@lru_cache(maxsize=None)
+def get_cue_lexicon():
+    """ Returns: the CueLexicon of the quote verbs, shared by the regexes and the dependency attribution """
+    data = pkgutil.get_data(__package__, 'quote_verb_list.txt').decode('utf8')
+    return CueLexicon(line.strip() for line in data.splitlines())
+
+
+def __getattr__(name):
+    if name == 'cue_lexicon':
+        value = get_cue_lexicon()
+    elif name == 'quote_verbs':
+        value = list(get_cue_lexicon())
+    elif name == 'quote_verb_boolean_string':
+        value = get_cue_lexicon().alternation()
+    elif name in PATTERN_TEMPLATES:
+        value = PATTERN_TEMPLATES[name].format(cue_verbs=get_cue_lexicon().alternation())
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    # Later accesses find the value without coming back here
+    globals()[name] = value
+    return value
+
+
+re_quote_someone_said_adding_colon = \
+    '([\w\W]+?) (“[\w\W]+?”)([-–\’\s,\w]*?) (adding)( \w*?){0,5}: (“[\w\W]+?”){1,1}'
+
+between_quotes = '“[^“”,]+?”'
+between_quotes_sentence_start = '$“[^“”]+?”'
+between_quotes_ends_with_comma = '“[^“”]+?,”'
+
+QUOTE_TYPES = {
+    'someone_said': 1,
+    'said_someone': 2,
+    'someone_told_someone': 3,
+    'someone_said_colon': 4,
+    'someone_said_adding_colon': 5,
+    'orphan': 6
+}
+# Regex quote types only: orphan quotes come from the sentence structure
+QUOTE_TYPES_PATTERNS = {
+    1: {'quote_text': 0, 'speaker': 1, 'quote_text_optional_second_part': -1},
+    2: {'quote_text': 0, 'speaker': 2, 'quote_text_optional_second_part': 3},
+    3: {'quote_text': 0, 'speaker': 1, 'quote_text_optional_second_part': 4},
+    4: {'quote_text': 3, 'speaker': 0},
+    5: {'quote_text': 0, 'quote_text_optional_second_part': 1, 'additional_cue': 3, 'quote_text_optional_third_part': 4}
+}
@@ -1,6 +1,9 @@
+import re
+from bisect import bisect_left
 from collections import OrderedDict
-from bs4 import BeautifulSoup
-from .constants import end_of_sentence_punc_list, open_quote_mark, close_quote_mark, generic_quote
+from html.entities import name2codepoint
+from html.parser import HTMLParser
+from .constants import open_quote_mark, close_quote_mark
 
 
 def remove_all_html(text):
@@ -12,6 +15,8 @@ def remove_all_html(text):
         
         returns: the plain text of an article
         """
+    # Imported here since the rest of the pipeline does not need it
+    from bs4 import BeautifulSoup
 
     soup = BeautifulSoup(text, features="html.parser")
 
@@ -60,24 +65,323 @@ def remove_all_html(text):
     return text
 
 
+class ArticleHTMLParser(HTMLParser):
+    """ Streaming version of `remove_all_html`: the text is collected in a single pass of html.parser over the HTML,
+        with no tree, no serialisation and no second parse.
+        It follows the tree that BeautifulSoup (4.9, see requirements.txt) would have built: an end tag closes the
+        elements opened after the matching start tag (and is ignored if no such element is open) and void elements
+        (e.g. <br>) are closed by their start tag. The h2, span, aside and figure elements are dropped with their
+        content, links are unwrapped and, as in the serialised soup that `remove_all_html` edits, a paragraph break is
+        a </p> followed by an attribute-less <p> with nothing but zero to two spaces in between, or an attribute-less
+        empty <br>. Like get_text, the text of comments, declarations and of script, style and template elements is
+        left out.
+        BeautifulSoup replaces a string made only of white space by a single new line (if it has one) or space, outside
+        of pre and textarea elements, and `remove_all_html` parses twice: the text between two tags is collapsed as
+        it is read, then again once the dropped elements, the links and the paragraph breaks no longer separate it from
+        the text around them.
+    """
+    DROPPED_ELEMENTS = frozenset(('h2', 'span', 'aside', 'figure'))
+    # Elements whose text get_text leaves out, and that the soup writes out as plain text
+    HIDDEN_ELEMENTS = frozenset(('script', 'style', 'template'))
+    # Elements whose white space is kept as it is
+    PREFORMATTED_ELEMENTS = frozenset(('pre', 'textarea'))
+    VOID_ELEMENTS = frozenset(('area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen', 'link',
+                               'menuitem', 'meta', 'param', 'source', 'track', 'wbr', 'basefont', 'bgsound',
+                               'command', 'frame', 'image', 'isindex', 'nextid', 'spacer'))
+    WHITE_SPACE = ' \n\t\x0c\r'
+    # The named character references BeautifulSoup knows (HTML 4 and &apos;): any other is kept as it is
+    ENTITIES = dict([(name, chr(codepoint)) for name, codepoint in name2codepoint.items()] + [('apos', "'")])
+
+    def __init__(self):
+        # The character references are resolved as BeautifulSoup does
+        super().__init__(convert_charrefs=False)
+        self.chunks = []
+        self.stack = []
+        # Depth in the stack of the dropped element being skipped, and numbers of open hidden and preformatted elements
+        self.dropped_at = None
+        self.hidden = 0
+        self.preformatted = 0
+        # Void elements whose next end tag is ignored, as their start tag closed them
+        self.closed_void = []
+        # A void element left open (a <br/> after a <br>) with nothing in it yet: (depth, markup kind)
+        self.open_void = None
+        # Text read since the last tag
+        self.data = []
+        # Text of the serialised soup since the last markup left in it, with the state it started in
+        self.string = []
+        self.string_hidden = False
+        self.string_preformatted = False
+        # Text since the last </p>, or None when the last markup was something else
+        self.after_paragraph = None
+
+    def _collapse(self, text, preformatted):
+        if not preformatted and not text.strip(self.WHITE_SPACE):
+            return '\n' if '\n' in text else ' '
+        return text
+
+    def _end_data(self):
+        # A string of the first parse
+        if self.data:
+            text = self._collapse(''.join(self.data), self.preformatted)
+            self.data = []
+            if self.dropped_at is None:
+                self._content()
+                if self.after_paragraph is not None:
+                    self.after_paragraph.append(text)
+                else:
+                    self._string(text)
+
+    def _string(self, text):
+        if not self.string:
+            self.string_hidden = bool(self.hidden)
+            self.string_preformatted = bool(self.preformatted)
+        self.string.append(text)
+
+    def _end_string(self):
+        # A string of the second parse
+        if self.string:
+            if not self.string_hidden:
+                self.chunks.append(self._collapse(''.join(self.string), self.string_preformatted))
+            self.string = []
+
+    def _content(self):
+        # A void element left open with something in it is written as a start tag, with no end tag
+        if self.open_void is not None:
+            self.open_void = None
+            self._end_string()
+
+    def _end_paragraph(self, kind=None):
+        # Returns: whether the markup `kind` ends a paragraph break started by a </p>
+        if self.after_paragraph is None:
+            return False
+        between = ''.join(self.after_paragraph)
+        self.after_paragraph = None
+        if kind == 'p' and between in ('', ' ', '  '):
+            self._string('\n')
+            return True
+        self._end_string()
+        if between:
+            self._string(between)
+        return False
+
+    def _markup(self, kind=None):
+        # Markup left in the serialised soup: `kind` is 'p' or 'br' for an attribute-less <p> or empty <br>, '/p' for
+        # </p>
+        self._content()
+        if self._end_paragraph(kind):
+            return
+        if kind == 'br':
+            self._string('\n')
+        elif kind == '/p':
+            self.after_paragraph = []
+        else:
+            self._end_string()
+
+    def _declaration(self, data):
+        # A comment, declaration or CDATA section. Returns: whether it is markup in the serialised soup
+        self._end_data()
+        if self.dropped_at is not None:
+            return False
+        if self.hidden:
+            self.data.append(data)
+            self._end_data()
+            return False
+        self._markup()
+        return True
+
+    def handle_starttag(self, tag, attrs, closes_void=True):
+        self._end_data()
+        kind = tag if tag in ('p', 'br') and not attrs else None
+        if tag in self.VOID_ELEMENTS:
+            if self.dropped_at is None:
+                if closes_void:
+                    self._markup(kind)
+                else:
+                    self._content()
+                    self._end_paragraph()
+                    self.open_void = (len(self.stack), kind)
+            if closes_void:
+                self.closed_void.append(tag)
+                return
+        elif self.dropped_at is None and tag != 'a' and tag not in self.DROPPED_ELEMENTS:
+            self._markup(kind)
+        self.stack.append(tag)
+        if self.dropped_at is None:
+            if tag in self.DROPPED_ELEMENTS:
+                self.dropped_at = len(self.stack) - 1
+            elif tag in self.HIDDEN_ELEMENTS:
+                self.hidden += 1
+            elif tag in self.PREFORMATTED_ELEMENTS:
+                self.preformatted += 1
+
+    def handle_endtag(self, tag):
+        if tag in self.closed_void:
+            self.closed_void.remove(tag)
+            return
+        self._end_data()
+        if tag in self.stack:
+            while self._pop() != tag:
+                pass
+
+    def _pop(self):
+        name = self.stack.pop()
+        if self.dropped_at is not None:
+            if len(self.stack) == self.dropped_at:
+                self.dropped_at = None
+        elif name in self.VOID_ELEMENTS:
+            if self.open_void is not None and self.open_void[0] == len(self.stack):
+                kind = self.open_void[1]
+                self.open_void = None
+                self._markup(kind)
+        elif name != 'a':
+            self._markup('/p' if name == 'p' else None)
+            if name in self.HIDDEN_ELEMENTS:
+                self.hidden -= 1
+            elif name in self.PREFORMATTED_ELEMENTS:
+                self.preformatted -= 1
+        return name
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs, closes_void=False)
+        self.handle_endtag(tag)
+
+    def handle_data(self, data):
+        self.data.append(data)
+
+    def handle_entityref(self, name):
+        self.data.append(self.ENTITIES.get(name, '&' + name))
+
+    def handle_charref(self, name):
+        codepoint = int(name[1:], 16) if name[0] in 'xX' else int(name)
+        data = None
+        if codepoint < 256:
+            # Often meant as Windows-1252, e.g. &#147; for a left double quotation mark
+            try:
+                data = bytes([codepoint]).decode('windows-1252')
+            except UnicodeDecodeError:
+                pass
+        if not data:
+            try:
+                data = chr(codepoint)
+            except (ValueError, OverflowError):
+                data = '\ufffd'
+        self.data.append(data)
+
+    def handle_comment(self, data):
+        self._declaration(data)
+
+    handle_pi = handle_comment
+
+    def handle_decl(self, decl):
+        if self._declaration(decl[len('DOCTYPE '):]):
+            # The soup writes a new line after a doctype
+            self._string('\n')
+
+    def unknown_decl(self, data):
+        is_cdata = data.upper().startswith('CDATA[')
+        if is_cdata:
+            data = data[len('CDATA['):]
+        if self._declaration(data) and is_cdata:
+            self.chunks.append(self._collapse(data, self.preformatted))
+
+    def close(self):
+        super().close()
+        self._end_data()
+        while self.stack:
+            self._pop()
+        self._markup()
+
+
+paragraph_start_regex = re.compile('\n')
+
+
+def html_to_text(html):
+    """ Same text as `remove_all_html`, from a single streaming pass over the HTML (see ArticleHTMLParser), along with
+        the offsets where its paragraphs start. It does not need BeautifulSoup.
+
+        :param html: the raw HTML of an article
+
+        returns: the plain text of the article, list of the offsets of its paragraphs (the start of the text and every
+                 position after a new line)
+    """
+    parser = ArticleHTMLParser()
+    parser.feed(html)
+    parser.close()
+    text = ''.join(parser.chunks)
+
+    text = text.replace('\n\n', '\n')
+    text = text.replace('”.“', '”. “')
+    text = text.replace("’", "'").replace("‘", "'")
+
+    return text, [0] + [match.end() for match in paragraph_start_regex.finditer(text)]
+
+
 def get_quote_indices(text_string):
     """ Get starting and ending index for quotation marks in `text_string`.
         Returns: list of lists containing start and end position of quotation marks with respect to `text_string`
     """
-    quote_count = 0
-    open_flag = False
-    q_indices = []
-    mq_indices = []
-    for i, char in enumerate(text_string):
-        if char == open_quote_mark and open_flag is False:
-            open_flag = True
-            open_quote_index = i
-        elif char == close_quote_mark and open_flag is True:
-            open_flag = False
-            close_quote_index = i
-            mq_indices.append([open_quote_index, close_quote_index])
-
-    return mq_indices
+    return QuoteIndex.from_text(text_string).pairs()
+
+
+quote_mark_regex = re.compile('[“”]')
+
+
+class QuoteIndex:
+    """ The quote mark pairs of an article, found once and queried by every stage instead of re-scanning the text.
+        Pairs are made as in `get_quote_indices`: an opening mark opens a quote unless one is already open, and a
+        closing mark closes it. Since pairs do not overlap, their start and end offsets are both sorted and lookups
+        are bisections.
+
+        :param starts: offsets of the opening marks of the pairs
+        :param ends: offsets of the closing marks of the pairs
+        :param unclosed_start: offset of an opening mark left open at the end of the text, if any
+    """
+    def __init__(self, starts: list, ends: list, unclosed_start: int = None):
+        self.starts = starts
+        self.ends = ends
+        self.unclosed_start = unclosed_start
+
+    @classmethod
+    def from_text(cls, text: str):
+        starts = []
+        ends = []
+        open_start = None
+        for match in quote_mark_regex.finditer(text):
+            if match.group() == open_quote_mark:
+                if open_start is None:
+                    open_start = match.start()
+            elif open_start is not None:
+                starts.append(open_start)
+                ends.append(match.start())
+                open_start = None
+        return cls(starts, ends, open_start)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __iter__(self):
+        return zip(self.starts, self.ends)
+
+    def pairs(self):
+        """ Returns: list of [start, end] lists, as `get_quote_indices` """
+        return [[start, end] for start, end in zip(self.starts, self.ends)]
+
+    def _range(self, start: int, end: int):
+        # The pairs lying entirely in [start, end) are a contiguous run of the sorted arrays
+        return bisect_left(self.starts, start), bisect_left(self.ends, end)
+
+    def count(self, start: int, end: int):
+        """ Returns: number of quotes within [start, end) """
+        first, last = self._range(start, end)
+        return max(last - first, 0)
+
+    def within(self, start: int, end: int, relative: bool = False):
+        """ Returns: list of [start, end] lists of the quotes within [start, end), with offsets relative to `start` if
+            `relative` (for a sentence, the result of `get_quote_indices` on its text)
+        """
+        first, last = self._range(start, end)
+        shift = start if relative else 0
+        return [[self.starts[i] - shift, self.ends[i] - shift] for i in range(first, last)]
 
 def uniq(lst):
     """ Create list with unique values (~ordered set) 
@@ -86,65 +390,129 @@ def uniq(lst):
     return list(OrderedDict.fromkeys(lst).keys())
 
 
-def filter_certain_tags(df):
+# CAPI articles kept by the filters: the news pillar, without the tracking tags of the desks whose pieces are not news
+NEWS_PILLAR = 'pillar/news'
+BLOCKED_TRACKING_TAGS = frozenset(('tracking/commissioningdesk/uk-weather',
+                                   'tracking/commissioningdesk/uk-letters-and-leader-writers',
+                                   'tracking/commissioningdesk/uk-obituaries'))
+
+
+def has_blocked_tag(tags, blocked_tags=BLOCKED_TRACKING_TAGS):
+    """ Whether the tracking tags of an article (a list, or a single string that is searched for every blocked tag)
+        include one of `blocked_tags` (a set).
+        Returns: bool
+    """
+    if not tags:
+        return False
+    if isinstance(tags, str):
+        return any(tag in tags for tag in blocked_tags)
+    return not blocked_tags.isdisjoint(tags)
+
+
+def filter_certain_tags(df, blocked_tags=BLOCKED_TRACKING_TAGS):
     """ Remove rows with undesirable tag from data frame.
         Returns: df
     """
     # Filtering to just news articles
-    new_df = df[df['pillar_id'] == 'pillar/news']
+    new_df = df[df['pillar_id'] == NEWS_PILLAR]
 
-    new_df = new_df[new_df['tracking_tag'].apply(lambda x: 'tracking/commissioningdesk/uk-weather' not in x)]
-    new_df = new_df[
-        new_df['tracking_tag'].apply(lambda x: 'tracking/commissioningdesk/uk-letters-and-leader-writers' not in x)]
-    new_df = new_df[new_df['tracking_tag'].apply(lambda x: 'tracking/commissioningdesk/uk-obituaries' not in x)]
+    blocked_tags = frozenset(blocked_tags)
+    new_df = new_df[new_df['tracking_tag'].apply(lambda x: not has_blocked_tag(x, blocked_tags))]
 
     return new_df
 
 
-def sentencise_text(text):
-    """ Splits text into sentences based no end of sentence punctuation. The spacy sentencisation wasn't working well
-    so built an alternative. Sometimes '.' are used in currency values so this ignores instances where the following
-    character is not a space."""
+class Sentence:
+    """ A sentence as a view on the article it comes from: its text is only copied out of the article when asked for.
 
-    sentences = []
+        :param article: the text of the article
+        :param start: character offset of the sentence in the article
+        :param end: character offset of the end of the sentence in the article (excluded)
+    """
+    __slots__ = ('article', 'start', 'end')
 
-    quote_open = False
-    sentence_start_indices = [0]
-    for i, char in enumerate(text):
-        try:
-            if char == open_quote_mark:
-                quote_open = True
-            elif char == close_quote_mark:
-                quote_open = False
+    def __init__(self, article: str, start: int, end: int):
+        self.article = article
+        self.start = start
+        self.end = end
 
-            # Manually prevent sentences ending when the organisation Which? is mentioned
-            elif char == '?' and text[i - 5:i + 1] == 'Which?' and quote_open == False:
-                pass
+    def __len__(self):
+        return self.end - self.start
 
-            elif char in end_of_sentence_punc_list and quote_open == False and (
-                    text[i + 1] == ' ' or text[i + 1] == '\n'):
-                sentence_start_indices.append(i + 1)
+    def __str__(self):
+        return self.article[self.start:self.end]
 
-            elif quote_open is False and char == '\n':
-                sentence_start_indices.append(i)
+    def __repr__(self):
+        return f"Sentence({self.start}, {self.end}, {str(self)!r})"
 
-            elif char in end_of_sentence_punc_list and quote_open is True and text[i + 1] == close_quote_mark and text[
-                i + 2] == ' ':
-                pass
+    @property
+    def text(self):
+        return str(self)
+
+    def find(self, sub: str):
+        """ Returns: offset of `sub` in the sentence, or -1 if it is not in it """
+        index = self.article.find(sub, self.start, self.end)
+        return index - self.start if index != -1 else -1
 
-            elif char in end_of_sentence_punc_list and quote_open is True and text[i + 1] == close_quote_mark:
+    def __contains__(self, sub: str):
+        return self.article.find(sub, self.start, self.end) != -1
+
+
+# The only characters other than quote marks that can end a sentence
+sentence_break_regex = re.compile('[.!?\n]')
+non_space_regex = re.compile('\\S')
+
+
+def sentence_spans(text, quote_index=None):
+    """ Same split as `sentencise_text`, but only the end of sentence punctuation and new lines are visited (found with
+        a regex), whether a quote is open there is read from the article's QuoteIndex (built if not given) and the
+        sentences are returned as views on `text` instead of copies.
+        Returns: list of Sentence
+    """
+    if quote_index is None:
+        quote_index = QuoteIndex.from_text(text)
+    starts, ends, unclosed_start = quote_index.starts, quote_index.ends, quote_index.unclosed_start
+    n_quotes = len(starts)
+    text_length = len(text)
+    quote = 0
+    sentence_start_indices = [0]
+    for match in sentence_break_regex.finditer(text):
+        i = match.start()
+        # The positions only go forward, so the quotes that closed before this one are left behind for good
+        while quote < n_quotes and ends[quote] < i:
+            quote += 1
+        quote_open = ((quote < n_quotes and starts[quote] < i) or
+                      (unclosed_start is not None and i > unclosed_start))
+        char = text[i]
+        if quote_open:
+            # A sentence ends inside a quote when the quote closes right after the punctuation, unless the quote is
+            # followed by a space (the sentence goes on, e.g. “Why?” she asked.) or ends the text
+            if char != '\n' and i + 2 < text_length and text[i + 1] == close_quote_mark and text[i + 2] != ' ':
                 sentence_start_indices.append(i + 2)
-            else:
-                pass
-        except IndexError:
+        elif char == '\n':
+            sentence_start_indices.append(i)
+        # Manually prevent sentences ending when the organisation Which? is mentioned
+        elif char == '?' and text[i - 5:i + 1] == 'Which?':
             pass
+        elif i + 1 < text_length and text[i + 1] in ' \n':
+            sentence_start_indices.append(i + 1)
 
+    sentences = []
     for previous, current in zip(sentence_start_indices, sentence_start_indices[1:]):
-        sentence = text[previous:current].lstrip()
-        sentences.append(sentence)
+        # Leading white space is left out, except for the last sentence
+        first_char = non_space_regex.search(text, previous, current)
+        if first_char is not None:
+            sentences.append(Sentence(text, first_char.start(), current))
+    if sentence_start_indices[-1] < text_length:
+        sentences.append(Sentence(text, sentence_start_indices[-1], text_length))
 
-    sentences.append(text[sentence_start_indices[-1] :len(text)])
+    return sentences
 
-    sentences = [sentence for sentence in sentences if sentence != '']
 
-    return sentences
+def sentencise_text(text):
+    """ Splits text into sentences based no end of sentence punctuation. The spacy sentencisation wasn't working well
+    so built an alternative. Sometimes '.' are used in currency values so this ignores instances where the following
+    character is not a space.
+    See `sentence_spans` for the positions of the sentences in `text`."""
+
+    return [str(sentence) for sentence in sentence_spans(text)]
@@ -1,125 +1,162 @@
 import logging
 import re
 
-from utils.classes import Quote
-from utils.preprocessing import sentencise_text, get_quote_indices, uniq
-from utils.functions_spacy3 import get_complete_ents_list
+from . import patterns
+from .classes import Quote
+from .constants import MODES
+from .context import ArticleContext, parse_in_batches
+from .preprocessing import sentencise_text, get_quote_indices, uniq
+from .patterns import (re_quote_someone_said_adding_colon, between_quotes, between_quotes_sentence_start,
+                       between_quotes_ends_with_comma, QUOTE_TYPES, QUOTE_TYPES_PATTERNS, get_cue_lexicon)
+from .regex_quotes import (has_quote_marks, parse_quote, parse_regex_matches, find_regex_matches,
+                           extract_quotes_sentence_regex, find_regex_quotes, extract_regex_quotes, DEFAULT_WINDOW)
+from .functions_spacy3 import get_complete_ents_list
 
 
-########################################################
-## Regex definitions and quote verb list
-########################################################
-
-with open('utils/quote_verb_list.txt', 'r') as f:
-    quote_verbs = [(line.strip()) for line in f]
-
-quote_verb_boolean_list = [quote + "|" for quote in quote_verbs]
-quote_verb_boolean_list = [quote + "|" for quote in quote_verbs if quote[-1:] in ['d', 'g', 's']]
-quote_verb_boolean_string = ''.join(quote_verb_boolean_list)
-quote_verb_boolean_string = quote_verb_boolean_string[:-1]
-
-re_quote_someone_said = \
-    r'(“[^“\n]+?[,?!]”) ([^\.!?]+?)[\n ]({cue_verbs})([^\.!?]*?)[\.,][\n ]{{0,2}}(“[\w\W]+?”){{0,1}}'.format(
-    cue_verbs= quote_verb_boolean_string)
-re_quote_said_someone = '(“[^“\n]+?[,?!]”)[\n ]({cue_verbs}) ([^\.!?]+?)[\.,](\s{{0,2}}“[^”]+?”){{0,1}}'.format(
-    cue_verbs=quote_verb_boolean_string)
-re_quote_someone_told_someone = \
-    '(“[^“\n]+?[,?!]”)[\n ]([^\.!?]*?) ({cue_verbs}) ([^\.!?]*?)[\.,][\n ]{{0,2}}(“[\w\W]+?”){{0,1}}'.format(
-    cue_verbs=quote_verb_boolean_string)
-re_quote_someone_said_colon = \
-    '([^“\n]+?) ({cue_verbs})( \w*?){{0,5}}: (“[\w\W]+?”){{1,1}}'.format(
-    cue_verbs=quote_verb_boolean_string)
-re_quote_someone_said_adding_colon = \
-    '([\w\W]+?) (“[\w\W]+?”)([-–\’\s,\w]*?) (adding)( \w*?){0,5}: (“[\w\W]+?”){1,1}'
-
-between_quotes = '“[^“”,]+?”'
-between_quotes_sentence_start = '$“[^“”]+?”'
-between_quotes_ends_with_comma = '“[^“”]+?,”'
-
-QUOTE_TYPES = {
-    'someone_said': 1,
-    'said_someone': 2,
-    'someone_told_someone': 3,
-    'someone_said_colon': 4,
-    'someone_said_adding_colon': 5
-}
-QUOTE_TYPES_PATTERNS = {
-    1: {'quote_text': 0, 'speaker': 1, 'quote_text_optional_second_part': -1},
-    2: {'quote_text': 0, 'speaker': 2, 'quote_text_optional_second_part': 3},
-    3: {'quote_text': 0, 'speaker': 1, 'quote_text_optional_second_part': 4},
-    4: {'quote_text': 3, 'speaker': 0},
-    5: {'quote_text': 0, 'quote_text_optional_second_part': 1, 'additional_cue': 3, 'quote_text_optional_third_part': 4}
-}
-
 ########################################################
 ## Function definitions
 ########################################################
 
-def parse_sentence_quotes(sents, nlp_model, debug=False):
-    """ Takes a list of sentences of the article and parses out quotes.
-        Uses spacy's dependency parser:
-        1) It replaces everything between quotes with a dummy phrase (to simplify the
-        structure of the sentence that spacy needs to parse).
-        2) It then checks each token. If a quote verb appears as the verb of a sentence, it finds the nsubj of the
-           sentence, collects the subtree of the nsubj and stores them as the speaker.
+def modify_sentence(sent):
+    """ Replaces everything between the quote marks of `sent` with a dummy phrase, to simplify the structure of the
+        sentence that spacy needs to parse.
+        Returns: modified sentence:str
+    """
+    if sent[0] == '“':
+        if sent.find(',”'):
+            modified_sent = re.sub(between_quotes_sentence_start, '“Dummy phrase,”', sent)
+    else:
+        if sent.find(',”'):
+            modified_sent = re.sub(between_quotes_ends_with_comma, '“dummy phrase,”', sent)
+        else:
+            modified_sent = re.sub(between_quotes, '“dummy phrase”', sent)
+    return modified_sent
 
-        TO BE IMPROVED:
-        For sentences that have two quotes within them, this process becomes quite difficult - current approach
-        is to split the sentence in two at the end of the first quote but this won't work for all sentences.
 
-        :param sents: the pre-processed text of an article split up into sentences
-        :param nlp: spacy model
+def prepare_sentence_quotes(sents, debug=False, sent_indices=None, quote_index=None):
+    """ First stage of `parse_sentence_quotes`: finds the sentences that can be attributed (those with one or two
+        quotes) and builds their modified sentence.
 
-        returns: a list of sentence_parse_quotes:
-                [quote_text, speaker (if possible), quote_verb, sent_index, start_index, end_index]
-                start_index and end_index are for the quote text and relative to the sentence.
-        """
+        :param sents: the pre-processed text of an article split up into sentences (strings or Sentence views)
+        :param sent_indices: only consider these sentences (default: all)
+        :param quote_index: QuoteIndex of the article, to look the quotes of Sentence views up instead of
+                            re-scanning them
+
+        returns: a list of [sent_index, sent, sentence_quote_indices, modified_sent]
+    """
     assert type(sents) == list
 
-    sentence_parse_quotes = []
-    for sent_index in range(len(sents)):
+    if sent_indices is None:
+        sent_indices = range(len(sents))
+
+    prepared = []
+    for sent_index in sent_indices:
         sent = sents[sent_index]
 
-        sentence_quote_indices = get_quote_indices(sent)
+        if quote_index is not None:
+            sentence_quote_indices = quote_index.within(sent.start, sent.end, relative=True)
+        else:
+            sentence_quote_indices = get_quote_indices(str(sent))
         if debug:
             logging.debug(sentence_quote_indices)
-        if len(sentence_quote_indices) == 0:
-            pass
-
-        else:
-            if sent[0] == '“':
-                if sent.find(',”'):
-                    modified_sent = re.sub(between_quotes_sentence_start, '“Dummy phrase,”', sent)
-            else:
-                if sent.find(',”'):
-                    modified_sent = re.sub(between_quotes_ends_with_comma, '“dummy phrase,”', sent)
-                else:
-                    modified_sent = re.sub(between_quotes, '“dummy phrase”', sent)
-
-            m_doc = nlp_model(modified_sent)
+        # Sentences with more than two quotes are not attributed, so there is no point parsing them
+        if len(sentence_quote_indices) in (1, 2):
+            sent = str(sent)
+            modified_sent = modify_sentence(sent)
             logging.debug(sent)
             logging.debug(modified_sent)
-            m_sentence_quote_indices = get_quote_indices(modified_sent)
+            prepared.append([sent_index, sent, sentence_quote_indices, modified_sent])
+
+    return prepared
 
-        if len(sentence_quote_indices) == 1:
-            for start_index, end_index in sentence_quote_indices:
-                m_start_index, m_end_index = m_sentence_quote_indices[0]
 
-                quote_text = sent[start_index:end_index + 1]
+def attribute_sentence_quotes(sent_index, sent, sentence_quote_indices, modified_sent, m_doc, sentence_parse_quotes,
+                              debug=False):
+    """ Last stage of `parse_sentence_quotes`: checks each token of the parsed modified sentence. If a quote verb
+        appears as the verb of a sentence, it finds the nsubj of the sentence, collects the subtree of the nsubj and
+        stores them as the speaker.
+
+        :param m_doc: the spacy Doc of `modified_sent`
+        :param sentence_parse_quotes: the article's list of quotes found so far, which is appended to
+    """
+    cue_verbs = get_cue_lexicon().forms
+    m_sentence_quote_indices = get_quote_indices(modified_sent)
+
+    if len(sentence_quote_indices) == 1:
+        for start_index, end_index in sentence_quote_indices:
+            m_start_index, m_end_index = m_sentence_quote_indices[0]
+
+            quote_text = sent[start_index:end_index + 1]
+
+            for tok in m_doc:
+                if ((tok.head.idx < m_start_index or tok.head.idx > m_end_index) and
+                        (tok.idx < m_start_index or tok.idx > m_end_index) and
+                        tok.dep_ == 'nsubj' and tok.head.pos_ == 'VERB' and tok.head.text in cue_verbs
+                ):
+                    subtree = [t for t in tok.subtree]
+                    idxes = [t.idx for t in subtree]
+                    speaker = modified_sent[idxes[0]:idxes[-1] + len(subtree[-1])]
+                    speaker = speaker.replace('“', '').replace('”', '').replace('dummy phrase', '').replace(
+                        'Dummy phrase', '').strip()
+                    logging.debug(sent)
+                    logging.debug(modified_sent)
+                    logging.debug(speaker)
+
+                    if speaker in ('He', 'She'):
+                        speaker = speaker.lower()
+                    quote_verb = tok.head.text
+                    sentence_parse_quotes.append(
+                        [quote_text, speaker, quote_verb, sent_index, start_index, end_index])
+                    break
+
+            try:
+                if quote_text != sentence_parse_quotes[-1][0] and quote_text[0] != '“' and quote_text[-1] != '”':
+                    for tok in m_doc:
+                        if (tok.head.pos_ == 'VERB' and tok.head.text in cue_verbs
+                        ):
+                            quote_verb = tok.head.text
+                            sentence_parse_quotes.append(
+                                [quote_text, '', quote_verb, sent_index, start_index, end_index])
+                            break
+
+            except IndexError:
+                pass
+
+    # deal with sentences with two quotes in by splitting the sentence in two
+    elif len(sentence_quote_indices) == 2:
+
+        first_quote_indices = sentence_quote_indices[0]
+        second_quote_indices = sentence_quote_indices[1]
+        end_of_first_quote = first_quote_indices[1] + 1
+
+        if debug:
+            logging.debug(m_sentence_quote_indices)
+            logging.debug('sent: ', sent)
+            logging.debug('modified_sent: ', modified_sent)
+        m_first_quote_indices = m_sentence_quote_indices[0]
+        m_second_quote_indices = m_sentence_quote_indices[1]
+        m_end_of_first_quote = m_first_quote_indices[1] + 1
+
+        quote_and_index_list = []
+        for start_index, end_index in sentence_quote_indices:
+            quote_text = sent[start_index:end_index + 1]
+            quote_and_index_list.append([quote_text, start_index, end_index])
+
+        for quote_text, start_index, end_index in quote_and_index_list:
+            for tok in m_doc:
+                if start_index == first_quote_indices[0]:
+                    m_start_index, m_end_index = m_first_quote_indices
 
-                for tok in m_doc:
                     if ((tok.head.idx < m_start_index or tok.head.idx > m_end_index) and
                             (tok.idx < m_start_index or tok.idx > m_end_index) and
-                            tok.dep_ == 'nsubj' and tok.head.pos_ == 'VERB' and tok.head.text in quote_verbs
+                            tok.dep_ == 'nsubj' and tok.head.pos_ == 'VERB' and tok.head.text in cue_verbs and
+                            tok.idx < m_end_of_first_quote
                     ):
                         subtree = [t for t in tok.subtree]
                         idxes = [t.idx for t in subtree]
                         speaker = modified_sent[idxes[0]:idxes[-1] + len(subtree[-1])]
                         speaker = speaker.replace('“', '').replace('”', '').replace('dummy phrase', '').replace(
                             'Dummy phrase', '').strip()
-                        logging.debug(sent)
-                        logging.debug(modified_sent)
-                        logging.debug(speaker)
 
                         if speaker in ('He', 'She'):
                             speaker = speaker.lower()
@@ -127,227 +164,190 @@ def parse_sentence_quotes(sents, nlp_model, debug=False):
                         sentence_parse_quotes.append(
                             [quote_text, speaker, quote_verb, sent_index, start_index, end_index])
                         break
+                elif start_index == second_quote_indices[0]:
+                    m_start_index, m_end_index = m_second_quote_indices
+                    #                         logging.debug(m_start_index, m_end_index, tok, tok.idx, tok.dep_, 'HEAD:', tok.head, tok.head.idx, tok.head.pos_)
+                    if ((tok.head.idx < m_start_index or tok.head.idx > m_end_index) and
+                            (tok.idx < m_start_index or tok.idx > m_end_index) and
+                            tok.dep_ == 'nsubj' and tok.head.pos_ == 'VERB' and tok.head.text in cue_verbs and
+                            tok.idx >= m_end_of_first_quote
+                    ):
+                        subtree = [t for t in tok.subtree]
+                        idxes = [t.idx for t in subtree]
+                        speaker = modified_sent[idxes[0]:idxes[-1] + len(subtree[-1])]
+                        speaker = speaker.replace('“', '').replace('”', '').strip()
 
-                try:
-                    if quote_text != sentence_parse_quotes[-1][0] and quote_text[0] != '“' and quote_text[-1] != '”':
-                        for tok in m_doc:
-                            if (tok.head.pos_ == 'VERB' and tok.head.text in quote_verbs
-                            ):
-                                quote_verb = tok.head.text
-                                sentence_parse_quotes.append(
-                                    [quote_text, '', quote_verb, sent_index, start_index, end_index])
-                                break
-
-                except IndexError:
-                    pass
-
-        # deal with sentences with two quotes in by splitting the sentence in two
-        elif len(sentence_quote_indices) == 2:
-
-            first_quote_indices = sentence_quote_indices[0]
-            second_quote_indices = sentence_quote_indices[1]
-            end_of_first_quote = first_quote_indices[1] + 1
-
-            m_sentence_quote_indices = get_quote_indices(modified_sent)
-            if debug:
-                logging.debug(m_sentence_quote_indices)
-                logging.debug('sent: ', sent)
-                logging.debug('modified_sent: ', modified_sent)
-            m_first_quote_indices = m_sentence_quote_indices[0]
-            m_second_quote_indices = m_sentence_quote_indices[1]
-            m_end_of_first_quote = m_first_quote_indices[1] + 1
-
-            quote_and_index_list = []
-            for start_index, end_index in sentence_quote_indices:
-                quote_text = sent[start_index:end_index + 1]
-                quote_and_index_list.append([quote_text, start_index, end_index])
-
-            for quote_text, start_index, end_index in quote_and_index_list:
-                for tok in m_doc:
-                    if start_index == first_quote_indices[0]:
-                        m_start_index, m_end_index = m_first_quote_indices
-
-                        if ((tok.head.idx < m_start_index or tok.head.idx > m_end_index) and
-                                (tok.idx < m_start_index or tok.idx > m_end_index) and
-                                tok.dep_ == 'nsubj' and tok.head.pos_ == 'VERB' and tok.head.text in quote_verbs and
-                                tok.idx < m_end_of_first_quote
-                        ):
-                            subtree = [t for t in tok.subtree]
-                            idxes = [t.idx for t in subtree]
-                            speaker = modified_sent[idxes[0]:idxes[-1] + len(subtree[-1])]
-                            speaker = speaker.replace('“', '').replace('”', '').replace('dummy phrase', '').replace(
-                                'Dummy phrase', '').strip()
-
-                            if speaker in ('He', 'She'):
-                                speaker = speaker.lower()
-                            quote_verb = tok.head.text
-                            sentence_parse_quotes.append(
-                                [quote_text, speaker, quote_verb, sent_index, start_index, end_index])
-                            break
-                    elif start_index == second_quote_indices[0]:
-                        m_start_index, m_end_index = m_second_quote_indices
-                        #                         logging.debug(m_start_index, m_end_index, tok, tok.idx, tok.dep_, 'HEAD:', tok.head, tok.head.idx, tok.head.pos_)
-                        if ((tok.head.idx < m_start_index or tok.head.idx > m_end_index) and
-                                (tok.idx < m_start_index or tok.idx > m_end_index) and
-                                tok.dep_ == 'nsubj' and tok.head.pos_ == 'VERB' and tok.head.text in quote_verbs and
-                                tok.idx >= m_end_of_first_quote
-                        ):
-                            subtree = [t for t in tok.subtree]
-                            idxes = [t.idx for t in subtree]
-                            speaker = modified_sent[idxes[0]:idxes[-1] + len(subtree[-1])]
-                            speaker = speaker.replace('“', '').replace('”', '').strip()
+                        if speaker in ('He', 'She'):
+                            speaker = speaker.lower()
+                        quote_verb = tok.head.text
+                        sentence_parse_quotes.append(
+                            [quote_text, speaker, quote_verb, sent_index, start_index, end_index])
+                        break
 
-                            if speaker in ('He', 'She'):
-                                speaker = speaker.lower()
+            try:
+                if quote_text != sentence_parse_quotes[-1][0] and quote_text[0] != '“' and quote_text[-1] != '”':
+                    for tok in m_doc:
+                        if (tok.head.pos_ == 'VERB' and tok.head.text in cue_verbs
+                        ):
                             quote_verb = tok.head.text
                             sentence_parse_quotes.append(
-                                [quote_text, speaker, quote_verb, sent_index, start_index, end_index])
+                                [quote_text, '', quote_verb, sent_index, start_index, end_index])
                             break
+            except IndexError:
+                pass
 
-                try:
-                    if quote_text != sentence_parse_quotes[-1][0] and quote_text[0] != '“' and quote_text[-1] != '”':
-                        for tok in m_doc:
-                            if (tok.head.pos_ == 'VERB' and tok.head.text in quote_verbs
-                            ):
-                                quote_verb = tok.head.text
-                                sentence_parse_quotes.append(
-                                    [quote_text, '', quote_verb, sent_index, start_index, end_index])
-                                break
-                except IndexError:
-                    pass
 
-    return sentence_parse_quotes
+def parse_sentence_quotes_batch(contexts, batch_size=None, debug=False, sent_indices=None):
+    """ `parse_sentence_quotes` for several articles at once, so that all of their modified sentences go through
+        spacy's `nlp.pipe` together:
+        1) builds the modified sentences of every article (`prepare_sentence_quotes`)
+        2) parses them all with `nlp_model.pipe` in batches of `batch_size`
+        3) attributes the quotes of each article from the parsed Docs (`attribute_sentence_quotes`)
+        The Docs are kept in each article's context, so a modified sentence identical to its sentence is only
+        parsed once.
 
+        :param contexts: a list of ArticleContext, one per article
+        :param batch_size: number of sentences parsed together (default: the model's batch size)
+        :param sent_indices: a list with the sentences to consider in each article (default: all of them)
 
-def parse_quote(list_, quote_pattern):
-    if quote_pattern is None:
-        raise ValueError(f"Incorrect quote pattern provided for '{list_}'")
-    return Quote(**dict((k, list_[quote_pattern[k]]) for k in quote_pattern))
-
+        returns: a list with the sentence_parse_quotes of each article, in the order of `contexts`
+    """
+    if len(contexts) == 0:
+        return []
+    if sent_indices is None:
+        sent_indices = [None] * len(contexts)
+
+    prepared = [prepare_sentence_quotes(context.spans, debug, article_sent_indices, context.quote_index)
+                for context, article_sent_indices in zip(contexts, sent_indices)]
+    parse_in_batches([(context, modified_sent)
+                      for context, article in zip(contexts, prepared)
+                      for _, _, _, modified_sent in article],
+                     contexts[0].nlp_model, batch_size)
 
-def parse_regex_matches(matches, quote_type):
     results = []
-    for match in matches:
-        # clean_match = filter(None, match)
-        quote = parse_quote(match, QUOTE_TYPES_PATTERNS.get(quote_type))
-        quote.QUOTE_TYPE = quote_type
-        results.append(quote)
+    for context, article in zip(contexts, prepared):
+        sentence_parse_quotes = []
+        for sent_index, sent, sentence_quote_indices, modified_sent in article:
+            attribute_sentence_quotes(sent_index, sent, sentence_quote_indices, modified_sent,
+                                      context.parse(modified_sent), sentence_parse_quotes, debug)
+        results.append(sentence_parse_quotes)
     return results
 
 
-def extract_quotes_sentence_regex(pattern, text):
-    """ Extract matching groups and sentences from `text` based on regex `pattern` provided.
-        Returns: list(tuple), list(str) – matched groups and sentences
+def parse_sentence_quotes(context, debug=False, batch_size=None, sent_indices=None):
+    """ Takes the context of an article and parses out quotes from its sentences.
+        Uses spacy's dependency parser:
+        1) It replaces everything between quotes with a dummy phrase (to simplify the
+        structure of the sentence that spacy needs to parse).
+        2) It then checks each token. If a quote verb appears as the verb of a sentence, it finds the nsubj of the
+           sentence, collects the subtree of the nsubj and stores them as the speaker.
+        The modified sentences are parsed together with `nlp.pipe`, see `parse_sentence_quotes_batch`.
+
+        TO BE IMPROVED:
+        For sentences that have two quotes within them, this process becomes quite difficult - current approach
+        is to split the sentence in two at the end of the first quote but this won't work for all sentences.
+
+        :param context: ArticleContext of the article (its sentences and spacy model)
+        :param batch_size: number of sentences parsed together (default: the model's batch size)
+        :param sent_indices: only parse these sentences (default: all)
+
+        returns: a list of sentence_parse_quotes:
+                [quote_text, speaker (if possible), quote_verb, sent_index, start_index, end_index]
+                start_index and end_index are for the quote text and relative to the sentence.
+        """
+    return parse_sentence_quotes_batch([context], batch_size, debug, [sent_indices])[0]
+
+
+def merge_sentence_parse_quotes(quotes, sentence_parse_quotes, context):
+    """ Joins the regex quotes with the sentence parse quotes by character offset: a sentence parse quote is the same
+        quote as a regex quote when its opening quote mark is at the same position in the article. The speaker from the
+        sentence parse includes less noise than the regex group, so it replaces it, and its quote verb becomes the cue.
+        Quotes without a match are left as they are.
+        Returns: `quotes`
     """
-    groups = []
-    sentences = []
-    for match in re.finditer(pattern, text):
-        groups.append(match.groups())
-        sentences.append(text[match.start():match.end()])
-    return groups, sentences
-
-def extract_quotes_and_sentence_speaker(text, nlp_model, debug=False):
-    """ Takes the pre-procsessed text of an article and returns a dictionary of attributed quotes, 
-        unattributed_quotes and quote marks only (everything else between quotes)
+    parsed = {}
+    for quote_text, speaker, quote_verb, sent_index, start_index, end_index in sentence_parse_quotes:
+        parsed.setdefault(context.spans[sent_index].start + start_index, (speaker, quote_verb))
+
+    for quote in quotes:
+        if quote.start in parsed:
+            speaker, quote_verb = parsed[quote.start]
+            if speaker:
+                quote.speaker = speaker
+            if quote.cue is None:
+                quote.cue = quote_verb
+    return quotes
+
+def extract_quotes_and_sentence_speaker(text, nlp_model, debug=False, batch_size=None, mode='full', matcher='scan',
+                                        window=DEFAULT_WINDOW, guard=None, unique=True):
+    """ Takes the pre-procsessed text of an article and returns its quotes and the sentences matched by the regular
+        expressions.
         
         
         Uses: 
         1) The regular expressions defined above to capture well-defined quotes
-        2) The parse_sentence_quotes function to capture quote fragments
-        3) Finds orphan quotes - those that are whole paragraphs in quote marks - and attributes them to the named
-           entity in the previous sentence (if available)
-        
-        For the regular expression quotes, if the sentence is also parsed well, it replaces the speaker from the 
-        regex quote with that from the sentence parsing because it includes less noise.
-        
+        2) The parse_sentence_quotes function to refine their speaker: if the sentence is also parsed well, the speaker
+           from the regex quote is replaced with that from the sentence parsing because it includes less noise (see
+           `merge_sentence_parse_quotes`)
+        3) Finds orphan quotes - those that are whole paragraphs in quote marks - and attributes them to the subject of
+           a quote verb in the previous sentence or, failing that, to the only named person in it (if available)
         
+        `mode` selects the stages that are run (see MODES): 'regex_only' runs 1) and never calls spacy (`nlp_model` can
+        be None), 'regex+parse' runs 1) and 2) and 'full' runs all three. Only the sentences containing a regex quote
+        are parsed in 2), since no other result of the sentence parse is used.
+        Articles without quote marks are returned straight away (see `has_quote_marks`). For regex-only triage
+        without importing spacy at all, use `utils.regex_quotes.extract_regex_quotes`.
+        With a RegexGuard (`utils.guard`), the text is cut to its length cap and the regular expressions run within its
+        time budgets, so a pathological article cannot stall the pipeline; `guard.report` tells what was cut or timed
+        out.
         
-        :param sents: the pre-processed text of an article split up into sentences
-        :param nlp: spacy model
+        :param text: the pre-processed text of an article
+        :param nlp_model: spacy model
+        :param batch_size: number of sentences parsed together by `parse_sentence_quotes`
+        :param mode: one of MODES
+        :param matcher: how the regular expressions are matched, one of `utils.regex_quotes.MATCHERS`
+        :param window: size of the windows around the quotes for the 'window' matcher
+        :param guard: RegexGuard bounding the time spent in the regular expressions
+        :param unique: remove the duplicate quotes and sentences (as found by different patterns or repeated in the
+                       article). The duplicates are kept for `utils.incremental`, which removes them once the quotes
+                       of every part of the article are put together.
         
-        returns: a dictionary of quotes:
-                {'attributed_quotes': those that can be given a speaker
-                  ,'unattributed_quotes': those that can't be given a speaker
-                  ,'just_quote_marks': Everything else. This will include quote fragments that can't be parsed 
-                                       correctly, so wrongly missed quotes are usually in here.
-                  }
+        returns: list of Quote, list(str) – quotes and the sentences matched by the regular expressions
         """
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode '{mode}', expected one of {MODES}")
 
-    sentences = sentencise_text(text)
-    if len(sentences) == 0:
-        logging.warning(f"Cannot sentencise '{sentences}'")
-        quotes_dict = {'attributed_quotes': [],
-                       'unattributed_quotes': [],
-                       'just_quote_marks': []
-                       }
-        return quotes_dict
-
-    all_regex_quotes = {}
-    all_regex_sentences = {}
-
-    all_regex_quotes['someone_said'], all_regex_sentences['someone_said'] = extract_quotes_sentence_regex(re_quote_someone_said, text)
-    all_regex_quotes['said_someone'], all_regex_sentences['said_someone'] = extract_quotes_sentence_regex(re_quote_said_someone, text)
-    all_regex_quotes['someone_told_someone'],  all_regex_sentences['someone_told_someone'] = extract_quotes_sentence_regex(re_quote_someone_told_someone, text)
-    all_regex_quotes['someone_said_colon'],  all_regex_sentences['someone_said_colon'] = extract_quotes_sentence_regex(re_quote_someone_said_colon, text)
-    article_quote_indices = get_quote_indices(text)
-    article_quote_texts = [text[quote_pair[0]:quote_pair[1] + 1] for quote_pair in article_quote_indices]
+    if guard is not None:
+        text = guard.start(text)
+    if not has_quote_marks(text):
+        return [], []
 
-    if debug:
-        logging.debug('someone_saids:', all_regex_quotes['someone_said'])
-        logging.debug('said_someones:', all_regex_quotes['said_someone'])
-        logging.debug('someone_told_someones:', all_regex_quotes['someone_told_someone'])
-        logging.debug('someone_said_colons:', all_regex_quotes['someone_said_colon'])
+    context = ArticleContext(text, nlp_model)
+    if len(context.spans) == 0:
+        logging.warning(f"Cannot sentencise '{text}'")
+        return [], []
 
-    # Parse the sentence out using spacy dependency and attribute using that
-    sentence_parse_quotes = parse_sentence_quotes(sentences, nlp_model)
+    regex_quotes, extra_adding_regex_quotes, regex_sentences = find_regex_quotes(context, debug, matcher, window,
+                                                                                guard)
 
-    # Orphan quotes: quotes that are entire paragraphs that follow on from a non-quote sentence
-    orphan_quotes = []
-    for quote in article_quote_texts:
-
-        for sent_index in range(len(sentences)):
-            sent = sentences[sent_index]
-            if quote == sent:
-                previous_sent = sentences[sent_index - 1]
-                sent_ents = get_complete_ents_list(previous_sent, nlp_model)
-                if '“' not in previous_sent and '”' not in previous_sent:
-                    doc = nlp_model(previous_sent)
-                    found = False
-                    for tok in doc:
-                        if (tok.dep_ == 'nsubj' and tok.head.pos_ == 'VERB' and tok.head.text in quote_verbs):
-                            subtree = [t for t in tok.subtree]
-                            idxes = [t.idx for t in subtree]
-                            speaker = previous_sent[idxes[0]:idxes[-1] + len(subtree[-1])]
-                            if speaker in ('He', 'She'):
-                                speaker = speaker.lower()
-                            quote_verb = tok.head.text
-                            orphan_quotes.append([quote, speaker, quote_verb, sent_index, sent_ents])
-                            found = True
-                            break
-                    if found == False:
-                        orphan_quotes.append([quote, '', '', sent_index, sent_ents])
+    if mode != 'regex_only':
+        # Parse the sentences of the regex quotes out using spacy dependency and refine their speaker with it
+        sent_indices = sorted(set(context.sentence_index(quote.start) for quote in regex_quotes))
+        sentence_parse_quotes = parse_sentence_quotes(context, batch_size=batch_size, sent_indices=sent_indices)
+        merge_sentence_parse_quotes(regex_quotes, sentence_parse_quotes, context)
 
+        if debug:
+            logging.debug('sentence_parse_quotes:')
+            logging.debug(sentence_parse_quotes)
 
-    # Parse regex quotes
-    regex_quotes = []
-    for qt_name, matches in all_regex_quotes.items():
-        regex_quotes.extend(parse_regex_matches(matches, QUOTE_TYPES.get(qt_name)))
-
+    orphan_quotes = []
+    if mode == 'full':
+        orphan_quotes = find_orphan_quotes(context)
 
     if debug:
-        logging.debug('sentence_parse_quotes:')
-        logging.debug(sentence_parse_quotes)
-
         logging.debug('regex_quotes:')
         logging.debug(regex_quotes)
 
-
-    extra_adding_regex_quotes = []
-    for sentence in sentences:
-        if len(get_quote_indices(sentence)) > 1:
-            extra_adding_regex_quote = re.findall(re_quote_someone_said_adding_colon, sentence)
-            if len(extra_adding_regex_quote) > 0: extra_adding_regex_quotes.extend(parse_regex_matches(extra_adding_regex_quote, QUOTE_TYPES['someone_said_adding_colon']))
-
     logging.debug('extra_adding_regex_quotes:')
     logging.debug(extra_adding_regex_quotes)
 
@@ -355,5 +355,66 @@ def extract_quotes_and_sentence_speaker(text, nlp_model, debug=False):
     logging.debug(regex_quotes)
 
     # Return quotes and sentences after removing duplicates
-    regex_sentences = [_ for sublist in all_regex_sentences.values() for _ in sublist]
+    if not unique:
+        return regex_quotes + extra_adding_regex_quotes + orphan_quotes, regex_sentences
     return list(set(regex_quotes)) + list(set(extra_adding_regex_quotes)) + orphan_quotes, list(set(regex_sentences))
+
+
+def find_orphan_quotes(context):
+    """ Orphan quotes: quotes that are entire paragraphs that follow on from a non-quote sentence. They are attributed
+        to the subject of a quote verb in the previous sentence or, failing that, to the only full name in it.
+        Returns: list of Quote
+    """
+    text = context.text
+    cue_verbs = get_cue_lexicon().forms
+
+    # A quote can only be a whole sentence if the sentence starts and ends with a quote mark, so only those sentences
+    # are indexed by their text
+    quote_sentences = {}
+    for sent_index, span in enumerate(context.spans):
+        if text[span.start] == '“' and text[span.end - 1] == '”':
+            quote_sentences.setdefault(str(span), []).append(sent_index)
+    if not quote_sentences:
+        return []
+
+    orphan_quotes = []
+    for quote_start, quote_end in context.quote_index:
+        quote = text[quote_start:quote_end + 1]
+
+        for sent_index in quote_sentences.get(quote, ()):
+            # The first sentence has no previous sentence (rather than the last one of the text, which would depend on
+            # how much of the article is extracted)
+            if sent_index == 0:
+                continue
+            previous_sent = context.sentence(sent_index - 1)
+            if '“' not in previous_sent and '”' not in previous_sent:
+                doc = context.sentence_doc(sent_index - 1)
+                speaker, quote_verb = None, None
+                for tok in doc:
+                    if (tok.dep_ == 'nsubj' and tok.head.pos_ == 'VERB' and tok.head.text in cue_verbs):
+                        subtree = [t for t in tok.subtree]
+                        idxes = [t.idx for t in subtree]
+                        speaker = previous_sent[idxes[0]:idxes[-1] + len(subtree[-1])]
+                        if speaker in ('He', 'She'):
+                            speaker = speaker.lower()
+                        quote_verb = tok.head.text
+                        break
+                # The entities are only needed when the parse found no speaker
+                if speaker is None:
+                    full_names = get_complete_ents_list(context, [sent_index - 1])[0]
+                    if len(full_names) == 1:
+                        speaker = full_names[0]
+
+                start = context.spans[sent_index].start
+                orphan_quote = Quote(quote, speaker, cue=quote_verb, start=start, end=start + len(quote))
+                orphan_quote.QUOTE_TYPE = QUOTE_TYPES['orphan']
+                orphan_quotes.append(orphan_quote)
+
+    return orphan_quotes
+
+
+def __getattr__(name):
+    # The patterns and quote verbs used to be defined here
+    if name in patterns.LAZY_NAMES:
+        return getattr(patterns, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
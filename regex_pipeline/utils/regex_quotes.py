@@ -0,0 +1,357 @@
+import logging
+import re
+from bisect import bisect_left, bisect_right
+
+from functools import lru_cache
+
+from . import patterns
+from .classes import Quote
+from .constants import open_quote_mark, close_quote_mark
+from .context import ArticleContext
+from .patterns import re_quote_someone_said_adding_colon, QUOTE_TYPES, QUOTE_TYPES_PATTERNS
+
+
+########################################################
+## Regex-only quote extraction
+## Nothing in here imports or calls spacy, so it can triage articles at regex speed
+########################################################
+
+@lru_cache(maxsize=None)
+def article_patterns():
+    """ Returns: list of (name, pattern) of the whole-text patterns, in the order they are applied """
+    return [('someone_said', patterns.re_quote_someone_said),
+            ('said_someone', patterns.re_quote_said_someone),
+            ('someone_told_someone', patterns.re_quote_someone_told_someone),
+            ('someone_said_colon', patterns.re_quote_someone_said_colon)]
+
+
+# How the whole-text patterns are matched:
+#   finditer: re.finditer over the whole text
+#   scan: only where the cue index says a match can start (same results, see `scan_regex_matches`)
+#   window: only within a window around each quote (cost grows with the number of quotes, see
+#           `window_regex_matches`)
+MATCHERS = ('finditer', 'scan', 'window')
+# Characters around a quote that the 'window' matcher looks at
+DEFAULT_WINDOW = 500
+
+
+def has_quote_marks(text):
+    """ Cheap prefilter: every pattern and every orphan quote needs a pair of curly quote marks, so an article
+        without both an opening and a closing mark cannot contain a quote.
+        Returns: bool
+    """
+    return open_quote_mark in text and close_quote_mark in text
+
+
+def parse_quote(list_, quote_pattern):
+    if quote_pattern is None:
+        raise ValueError(f"Incorrect quote pattern provided for '{list_}'")
+    return Quote(**dict((k, list_[quote_pattern[k]]) for k in quote_pattern))
+
+
+def parse_regex_matches(matches, quote_type, offset=0, default=None):
+    """ Turn regex matches into Quotes of type `quote_type`.
+        `matches` are either tuples of groups or match objects. For match objects, the character offsets of the
+        quote_text group (shifted by `offset`, the position of the matched text in the article) are kept on the Quote,
+        and when the match is on the article itself (`offset` 0) the quote text is read from it instead of copied.
+        The groups that did not take part in a match are given `default` ('' as `re.findall` does, or None as
+        `match.groups()` does).
+        Returns: list of Quote
+    """
+    quote_pattern = QUOTE_TYPES_PATTERNS.get(quote_type)
+    results = []
+    for match in matches:
+        # clean_match = filter(None, match)
+        if isinstance(match, re.Match):
+            if quote_pattern is None:
+                raise ValueError(f"Incorrect quote pattern provided for '{match.groups()}'")
+            # The pattern indices are into the groups tuple and can be negative
+            groups = match.groups(default)
+            fields = dict((k, groups[quote_pattern[k]]) for k in quote_pattern if k != 'quote_text')
+            quote_group = quote_pattern['quote_text'] % match.re.groups + 1
+            start, end = match.span(quote_group)
+            if offset == 0:
+                quote = Quote(None, start=start, end=end, article=match.string, **fields)
+            else:
+                quote = Quote(match.group(quote_group), start=offset + start, end=offset + end, **fields)
+        else:
+            quote = parse_quote(match, quote_pattern)
+        quote.QUOTE_TYPE = quote_type
+        results.append(quote)
+    return results
+
+
+def find_regex_matches(pattern, text):
+    """ Returns: list of the match objects of regex `pattern` in `text` """
+    return list(re.finditer(pattern, text))
+
+
+def extract_quotes_sentence_regex(pattern, text):
+    """ Extract matching groups and sentences from `text` based on regex `pattern` provided.
+        Returns: list(tuple), list(str) – matched groups and sentences
+    """
+    groups = []
+    sentences = []
+    for match in re.finditer(pattern, text):
+        groups.append(match.groups())
+        sentences.append(text[match.start():match.end()])
+    return groups, sentences
+
+
+########################################################
+## Cue index: a single pass over the article finding the opening quote marks and the cue verbs
+########################################################
+
+def build_trie_regex(words):
+    """ Builds a regex matching any of `words` from a character trie of them, e.g. ['said', 'says'] -> 'sa(?:id|ys)'.
+        Unlike a flat alternation, the regex engine only follows the branches that match the text.
+        Returns: regex:str
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def to_regex(node):
+        ends_here = '' in node
+        branches = [re.escape(char) + to_regex(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        regex = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if ends_here:
+            regex = '(?:' + regex + ')?'
+        return regex
+
+    return to_regex(trie)
+
+
+sentence_end_regex = re.compile('[.!?]')
+
+
+# The regexes below depend on the quote verbs, so they are compiled on first use
+@lru_cache(maxsize=None)
+def get_cue_index_regex():
+    """ Returns: the compiled regex of `build_cue_index`: group 1 is an opening quote mark, group 2 the start of a cue
+        verb (preceded by a space or a new line, as in the patterns)
+    """
+    return re.compile('(“)|(?<=[\n ])({cue_verbs})'.format(
+        cue_verbs=build_trie_regex(patterns.get_cue_lexicon().regex_forms())))
+
+
+@lru_cache(maxsize=None)
+def get_quote_first_patterns():
+    """ Returns: set of the whole-text patterns that start with the quote """
+    return {patterns.re_quote_someone_said, patterns.re_quote_said_someone, patterns.re_quote_someone_told_someone}
+
+
+@lru_cache(maxsize=None)
+def get_colon_head_regex():
+    return re.compile(patterns.re_quote_someone_said_colon_head)
+
+
+def build_cue_index(text):
+    """ Finds every opening quote mark and every cue verb of `text` in one pass.
+        Returns: list(int), list(int) – sorted positions of the opening quote marks and of the cue verbs
+    """
+    quote_starts = []
+    verb_starts = []
+    for match in get_cue_index_regex().finditer(text):
+        if match.group(1):
+            quote_starts.append(match.start())
+        else:
+            verb_starts.append(match.start())
+    return quote_starts, verb_starts
+
+
+def _scan_quote_first(pattern, text, quote_starts, verb_starts):
+    # someone_said, said_someone, someone_told_someone: a match starts with '“[^“\n]+?[,?!]”', followed by its cue
+    # verb before the end of the sentence ([.!?]). So only the opening quote marks with a closing mark before the
+    # next opening mark or new line, and a cue verb between them and the sentence end after that closing mark, are
+    # tried.
+    matches = []
+    position = 0
+    text_length = len(text)
+    for quote_start in quote_starts:
+        if quote_start < position:
+            continue
+        next_open = text.find('“', quote_start + 1)
+        next_line = text.find('\n', quote_start + 1)
+        limit = min(next_open if next_open != -1 else text_length, next_line if next_line != -1 else text_length)
+        last_close = text.rfind('”', quote_start + 1, limit)
+        if last_close == -1:
+            continue
+        sentence_end = sentence_end_regex.search(text, last_close + 1)
+        bound = sentence_end.start() if sentence_end else text_length
+        verb_index = bisect_right(verb_starts, quote_start)
+        if verb_index == len(verb_starts) or verb_starts[verb_index] > bound:
+            continue
+        match = pattern.match(text, quote_start)
+        if match:
+            matches.append(match)
+            position = match.end()
+    return matches
+
+
+def _scan_someone_said_colon(pattern, text, quote_starts, verb_starts):
+    # someone_said_colon: everything up to '“' stays on one line, so a match can only start on a line with a ': “'
+    # after a cue verb. The pattern without its quote (colon_head_regex) is searched in that line only, and the full
+    # pattern from where it matches.
+    colon_head_regex = get_colon_head_regex()
+    matches = []
+    position = 0
+    skip_until = -1
+    for quote_start in quote_starts:
+        if quote_start < position or quote_start < skip_until or text[quote_start - 2:quote_start] != ': ':
+            continue
+        start = max(position, text.rfind('\n', 0, quote_start) + 1)
+        verb_index = bisect_left(verb_starts, start)
+        if verb_index == len(verb_starts) or verb_starts[verb_index] >= quote_start:
+            continue
+        line_end = text.find('\n', quote_start)
+        if line_end == -1:
+            line_end = len(text)
+        head = colon_head_regex.search(text, start, line_end)
+        if head is None:
+            skip_until = line_end
+            continue
+        match = pattern.search(text, head.start())
+        if match:
+            matches.append(match)
+            position = match.end()
+    return matches
+
+
+def scan_regex_matches(pattern, text, cue_index=None):
+    """ Same result as `find_regex_matches` for the whole-text patterns, but the pattern is only tried where the cue
+        index (`build_cue_index`) shows that a match can start, instead of at every position of the text.
+        Returns: list of match objects
+    """
+    quote_starts, verb_starts = cue_index if cue_index is not None else build_cue_index(text)
+    if pattern in get_quote_first_patterns():
+        return _scan_quote_first(re.compile(pattern), text, quote_starts, verb_starts)
+    elif pattern == patterns.re_quote_someone_said_colon:
+        return _scan_someone_said_colon(re.compile(pattern), text, quote_starts, verb_starts)
+    return find_regex_matches(pattern, text)
+
+
+def window_regex_matches(pattern, text, quote_indices, window=DEFAULT_WINDOW):
+    """ Matches a whole-text pattern only within bounded windows around the quote mark pairs of `quote_indices`
+        (a QuoteIndex, or pairs from `get_quote_indices`), so the cost grows with the number of quotes rather than the length of the text.
+        The patterns starting with a quote are matched from each opening mark up to `window` characters after its
+        closing mark; someone_said_colon is matched from up to `window` characters before each ': “' to its
+        closing mark.
+        This is an approximation of `find_regex_matches`: a speaker or second part longer than the window, or a match
+        starting at an opening mark that get_quote_indices does not pair (one inside an open quote), is missed.
+        Returns: list of match objects
+    """
+    compiled = re.compile(pattern)
+    quote_first_patterns = get_quote_first_patterns()
+    colon_head_regex = get_colon_head_regex()
+    text_length = len(text)
+    matches = []
+    position = 0
+    for quote_start, quote_end in quote_indices:
+        if quote_start < position:
+            continue
+        if pattern in quote_first_patterns:
+            match = compiled.match(text, quote_start, min(quote_end + 1 + window, text_length))
+        elif pattern == patterns.re_quote_someone_said_colon:
+            if text[quote_start - 2:quote_start] != ': ':
+                continue
+            start = max(position, quote_start - window, text.rfind('\n', 0, quote_start) + 1)
+            head = colon_head_regex.search(text, start, quote_start + 1)
+            match = compiled.match(text, head.start(), quote_end + 1) if head else None
+        else:
+            return find_regex_matches(pattern, text)
+        if match:
+            matches.append(match)
+            position = match.end()
+    return matches
+
+
+def find_regex_quotes(context, debug=False, matcher='scan', window=DEFAULT_WINDOW, guard=None):
+    """ Runs the regular expressions over an article: the whole-text patterns over its text and the 'adding' pattern
+        over its sentences with more than one quote. The quotes keep the character offsets of their quote text.
+
+        :param context: ArticleContext of the article (only its text, sentences and quote indices are used)
+        :param matcher: how the whole-text patterns are matched, one of MATCHERS
+        :param window: size of the windows around the quotes for the 'window' matcher
+        :param guard: RegexGuard started for the article, to run every pattern within its time budgets
+
+        returns: list of Quote, list of Quote, list(str) – quotes from the whole-text patterns, quotes from the
+                 'adding' pattern and the matched sentences
+    """
+    if matcher not in MATCHERS:
+        raise ValueError(f"Unknown matcher '{matcher}', expected one of {MATCHERS}")
+    text = context.text
+    cue_index = build_cue_index(text) if matcher == 'scan' else None
+
+    regex_quotes = []
+    regex_sentences = []
+    for qt_name, pattern in article_patterns():
+        if matcher == 'scan':
+            match_args = (scan_regex_matches, pattern, text, cue_index)
+        elif matcher == 'window':
+            match_args = (window_regex_matches, pattern, text, context.quote_index, window)
+        else:
+            match_args = (find_regex_matches, pattern, text)
+        matches = guard.run(qt_name, *match_args) if guard is not None else match_args[0](*match_args[1:])
+        if debug:
+            logging.debug(f'{qt_name}: {[match.groups() for match in matches]}')
+        regex_quotes.extend(parse_regex_matches(matches, QUOTE_TYPES[qt_name]))
+        regex_sentences.extend(match.group() for match in matches)
+
+    extra_adding_regex_quotes = []
+    for sent_index, span in enumerate(context.spans):
+        # The literal parts of the pattern are cheap to look for first, in place in the article
+        if ' adding' not in span or ': “' not in span:
+            continue
+        sentence = str(span)
+        if context.quote_index.count(span.start, span.end) > 1:
+            if guard is not None:
+                extra_adding_regex_quote = guard.run('someone_said_adding_colon', find_regex_matches,
+                                                     re_quote_someone_said_adding_colon, sentence)
+            else:
+                extra_adding_regex_quote = find_regex_matches(re_quote_someone_said_adding_colon, sentence)
+            # As re.findall did, the groups that took no part in the match are ''
+            if len(extra_adding_regex_quote) > 0: extra_adding_regex_quotes.extend(parse_regex_matches(extra_adding_regex_quote, QUOTE_TYPES['someone_said_adding_colon'], span.start, default=''))
+
+    return regex_quotes, extra_adding_regex_quotes, regex_sentences
+
+
+def extract_regex_quotes(text, debug=False, matcher='scan', window=DEFAULT_WINDOW, guard=None, unique=True):
+    """ Regex-only engine: the result of `extract_quotes_and_sentence_speaker(text, None, mode='regex_only')` without
+        importing spacy. Articles without quote marks are skipped before being sentencised.
+        With a RegexGuard (`utils.guard`), the text is cut to its length cap and the patterns run within its time
+        budgets; `guard.report` then tells what was cut or timed out. With `unique` False the duplicates are kept.
+        Returns: list of Quote, list(str) – quotes and the sentences matched by the regular expressions
+    """
+    if guard is not None:
+        text = guard.start(text)
+    if not has_quote_marks(text):
+        return [], []
+
+    regex_quotes, extra_adding_regex_quotes, regex_sentences = find_regex_quotes(ArticleContext(text, None), debug,
+                                                                                matcher, window, guard)
+    if not unique:
+        return regex_quotes + extra_adding_regex_quotes, regex_sentences
+    return list(set(regex_quotes)) + list(set(extra_adding_regex_quotes)), list(set(regex_sentences))
+
+
+# Module attributes computed on first access, so that importing this module does not build the regexes
+_LAZY_ATTRIBUTES = {
+    'ARTICLE_PATTERNS': article_patterns,
+    'cue_index_regex': get_cue_index_regex,
+    'quote_first_patterns': get_quote_first_patterns,
+    'colon_head_regex': get_colon_head_regex,
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        return _LAZY_ATTRIBUTES[name]()
+    if name in patterns.LAZY_NAMES:
+        return getattr(patterns, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,189 @@
+import re
+
+from .functions_spacy3 import get_life_peers, name_normaliser, royal_dict
+from .patterns import get_cue_lexicon
+
+# Speakers that are never resolved to a name
+PRONOUNS = frozenset(['he', 'she', 'they', 'i', 'we', 'you', 'it', 'him', 'her', 'them'])
+# Capitalised words found before the names of the regex speakers: the words sentences start with and the titles that
+# are not removed by the name cleaning
+NOT_NAME_WORDS = PRONOUNS | frozenset([
+    'a', 'an', 'and', 'after', 'also', 'as', 'asked', 'at', 'before', 'but', 'earlier', 'for', 'here', 'however',
+    'if', 'in', 'instead', 'last', 'later', 'meanwhile', 'now', 'on', 'once', 'one', 'only', 'so', 'speaking',
+    'still', 'that', 'the', 'then', 'there', 'this', 'today', 'tonight', 'when', 'while', 'yesterday', 'his', 'her',
+    'their', 'our', 'my', 'your', 'its', 'monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday',
+    'sunday', 'president', 'prime', 'minister', 'chancellor', 'senator', 'governor', 'mayor', 'judge', 'justice',
+    'mp', 'msp', 'councillor', 'leader', 'spokesman', 'spokeswoman', 'spokesperson'])
+# The end of a sentence within a speaker
+sentence_end_regex = re.compile(r'[.!?;:…][\'"”]*\s+')
+
+
+def normalise_alias(name):
+    """ Returns: the key of `name` in a SpeakerAliasIndex: lower case, single spaces, straight apostrophes and without
+        a leading 'the' or a trailing possessive """
+    name = ' '.join(name.replace('’', "'").split()).lower()
+    if name.startswith('the '):
+        name = name[4:]
+    if name.endswith("'s"):
+        name = name[:-2]
+    return name.rstrip("'")
+
+
+def _without_leading_words(name):
+    # The words a name of a speaker can start with that are not part of it, e.g. 'Yesterday', 'President' or a quote
+    # verb ('Said Ann Smith')
+    cue_verbs = get_cue_lexicon().forms
+    words = name.split()
+    while words and (words[0].lower() in NOT_NAME_WORDS or words[0].lower() in cue_verbs):
+        del words[0]
+    return ' '.join(words)
+
+
+def speaker_names(speaker):
+    """ The names in a speaker: in the last sentence of the speaker (a regex speaker can run over the end of a
+        sentence, e.g. 'tweeted He. Flint'), the capitalised words ending it (abbreviations such as MP end the name),
+        cleaned (see `cleaning_names`), e.g. 'Caroline Flint' for 'Labour MP Caroline Flint' and 'Keir Starmer' for
+        'Sir Keir Starmer', then the names of the sentence itself cleaned that start and end with a capital. The words
+        that start sentences rather than names (pronouns, 'Yesterday', 'President', see NOT_NAME_WORDS, and the quote
+        verbs) are left out.
+        Returns: list of names
+    """
+    words = sentence_end_regex.split(speaker.replace('’', "'"))[-1].split()
+    n_capitalised = 0
+    while (n_capitalised < len(words) and words[-1 - n_capitalised][0].isupper() and
+           not words[-1 - n_capitalised].isupper()):
+        n_capitalised += 1
+    names = list(name_normaliser.clean_name(' '.join(words[-n_capitalised:]))) if n_capitalised else []
+    if n_capitalised < len(words):
+        names.extend(name for name in name_normaliser.clean_name(' '.join(words)) if name not in names)
+    names = dict.fromkeys(_without_leading_words(name) for name in names)
+    return [name for name in names if name and name[0].isupper() and name.split()[-1][0].isupper()]
+
+
+def article_full_names(speakers):
+    """ The full names among the speakers of an article, for `SpeakerAliasIndex.for_article`: the names of two or
+        three words of the speakers (see `speaker_names`).
+        Returns: list of names, in the order they first appear
+    """
+    full_names = {}
+    for speaker in speakers:
+        if speaker:
+            for name in speaker_names(speaker):
+                if 2 <= len(name.split()) <= 3:
+                    full_names.setdefault(name, None)
+    return list(full_names)
+
+
+class SpeakerAliasIndex:
+    """ Hash map from the normalised aliases of people (see `normalise_alias`) to a canonical id, to resolve the
+        speakers of the quotes in O(1) per lookup, e.g. 'Duke of Sussex', 'Prince Harry' -> 'Prince Harry'. The id of a
+        person is their canonical name. Aliases are exact names (the canonical name, the aliases given, the peer
+        titles) or surnames; a surname claimed by two people is left unresolved.
+        The index of an article (`for_article`) is built on top of the corpus one (`base`, e.g. the royals of
+        `royal_dict`, see `royal_index`), which is built once and never copied. Its exact names come first, then those
+        of the base, then its surnames.
+
+        :param entities: mapping of canonical id -> list of its aliases
+        :param base: index looked up after the exact names of this one
+    """
+    def __init__(self, entities=None, base=None):
+        self.base = base
+        self.aliases = {}
+        # surname -> id, None when two ids share it
+        self.surnames = {}
+        for entity_id, aliases in (entities or {}).items():
+            self.add(entity_id, aliases)
+
+    def add(self, entity_id, aliases=()):
+        """ Maps `entity_id` and its `aliases` to `entity_id`, unless they are an alias already """
+        for alias in (entity_id, *aliases):
+            key = normalise_alias(alias)
+            if key:
+                self.aliases.setdefault(key, entity_id)
+
+    def add_surname(self, surname, entity_id):
+        """ Maps `surname` to `entity_id`, or to nothing if it is the surname of another id already """
+        key = normalise_alias(surname)
+        if key:
+            self.surnames[key] = entity_id if self.surnames.get(key, entity_id) == entity_id else None
+
+    def add_full_name(self, name):
+        """ Maps a full name to itself (or to the id it is an alias of, e.g. 'Meghan Markle'), and its surname (the last
+            word, and the last two of a name of three words, e.g. 'Bin Laden') to it """
+        entity_id = self._exact(normalise_alias(name)) or name
+        self.add(entity_id)
+        words = name.split()
+        if len(words) > 1:
+            self.add_surname(words[-1], entity_id)
+        if len(words) == 3:
+            self.add_surname(' '.join(words[1:]), entity_id)
+
+    def add_peer(self, peer):
+        """ Maps a peer ('Lord Smith') to itself (or to the id it is an alias of), and its name to it as a surname """
+        entity_id = self._exact(normalise_alias(peer)) or peer
+        self.add(entity_id)
+        self.add_surname(peer.split(' ', 1)[1], entity_id)
+
+    def for_article(self, text, full_names=()):
+        """ The index of an article on top of this one, with the peers of its `text` (see `get_life_peers`) and its
+            `full_names` (e.g. those of `get_complete_ents_list` or `article_full_names`).
+            Returns: SpeakerAliasIndex
+        """
+        index = SpeakerAliasIndex(base=self)
+        for name in full_names:
+            index.add_full_name(name)
+        for peer in get_life_peers(text):
+            index.add_peer(peer)
+        return index
+
+    def _exact(self, key):
+        index = self
+        while index is not None:
+            entity_id = index.aliases.get(key)
+            if entity_id is not None:
+                return entity_id
+            index = index.base
+        return None
+
+    def _surname(self, key):
+        index = self
+        while index is not None:
+            if key in index.surnames:
+                return index.surnames[key]
+            index = index.base
+        return None
+
+    def resolve(self, speaker):
+        """ Canonical id of a speaker: an exact alias of the speaker, or of one of its names (see `speaker_names`, e.g.
+            without its title), else the surname of one person.
+            Returns: id or None (pronouns, descriptions such as 'the prime minister', unknown and ambiguous names)
+        """
+        if not speaker:
+            return None
+        key = normalise_alias(speaker)
+        if not key or key in PRONOUNS:
+            return None
+        entity_id = self._exact(key)
+        if entity_id is not None:
+            return entity_id
+        keys = [normalise_alias(name) for name in speaker_names(speaker)]
+        for key in keys:
+            entity_id = self._exact(key)
+            if entity_id is not None:
+                return entity_id
+        for key in keys:
+            entity_id = self._surname(key)
+            if entity_id is not None:
+                return entity_id
+        return None
+
+
+_royal_index = None
+
+
+def royal_index():
+    """ Returns: the SpeakerAliasIndex of the royals of `royal_dict`, built on the first call """
+    global _royal_index
+    if _royal_index is None:
+        _royal_index = SpeakerAliasIndex(royal_dict)
+    return _royal_index
@@ -0,0 +1,319 @@
+import gzip
+import io
+import json
+import logging
+import os
+
+
+########################################################
+## Streaming result writer
+########################################################
+
+COMPRESSIONS = ('none', 'gzip', 'zstd')
+EXTENSIONS = {'none': '', 'gzip': '.gz', 'zstd': '.zst'}
+
+
+def open_compressed(path, compression='none', mode='wt'):
+    """ Opens `path` for reading ('rt') or writing ('wt') text, compressed with `compression` (one of COMPRESSIONS).
+        zstd needs the `zstandard` package.
+        Returns: text file object
+    """
+    if compression in (None, 'none'):
+        return open(path, mode, encoding='utf8')
+    if compression == 'gzip':
+        return gzip.open(path, mode, encoding='utf8')
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("zstd compression needs the 'zstandard' package (pip install zstandard)")
+        if mode == 'rt':
+            stream = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+        else:
+            stream = zstandard.ZstdCompressor().stream_writer(open(path, 'wb'), closefd=True)
+        return io.TextIOWrapper(stream, encoding='utf8')
+    raise ValueError(f"Unknown compression '{compression}', expected one of {COMPRESSIONS}")
+
+
+class ShardedJsonlWriter:
+    """ Writes records to JSON lines as they come, instead of collecting them first.
+        Lines are buffered and written `flush_every` records at a time. Without `shard_size_mb` and compression the
+        output is the single file `path`. Otherwise the records are written to shards next to it
+        ('<name>-00000.jsonl[.gz|.zst]', ...), a new shard being started once the current one holds `shard_size_mb`
+        of (uncompressed) JSON, and a manifest ('<name>.manifest.json') lists every shard with its number of records,
+        quotes and bytes, so that the shards can be loaded in parallel. The lines of the records replaced by a later
+        record (see `supersede`) are listed as 'superseded' in their shard, and the manifest is then written for a
+        single output too; `iter_output` reads the records without them.
+        Use it as a context manager, or call `close` to write the last lines and the manifest.
+        To carry on with the output of an earlier run (see `utils.checkpoint`), pass the shards it had written in
+        `resume_shards`: the last one is cut back to the records listed for it and the new records go after them.
+
+        :param path: output file, e.g. ./data/quotes_results.jsonl (its folder is created if needed)
+        :param shard_size_mb: size limit of a shard (None for a single output)
+        :param compression: one of COMPRESSIONS
+        :param flush_every: number of records buffered before they are written
+        :param on_flush: called with the writer once buffered records are written to disk
+        :param resume_shards: list of the shard dicts ('path', 'records', 'quotes', 'bytes' and 'superseded') of an
+                              earlier run
+    """
+    def __init__(self, path: str, shard_size_mb: float = None, compression: str = 'none', flush_every: int = 1000,
+                 on_flush=None, resume_shards: list = None):
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression '{compression}', expected one of {COMPRESSIONS}")
+        self.path = path
+        self.shard_size = int(shard_size_mb * 1024 * 1024) if shard_size_mb else None
+        self.compression = compression
+        self.flush_every = flush_every
+        self.on_flush = on_flush
+        self.sharded = self.shard_size is not None or compression != 'none'
+        self.shards = []
+        self._file = None
+        self._buffer = []
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        name = os.path.basename(path)
+        self.stem = name[:-len('.jsonl')] if name.endswith('.jsonl') else name
+        self.directory = directory
+        if resume_shards:
+            self._resume(resume_shards)
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.directory, f'{self.stem}.manifest.json')
+
+    def _shard_path(self, index):
+        return os.path.join(self.directory, f'{self.stem}-{index:05d}.jsonl{EXTENSIONS[self.compression]}')
+
+    def _open_shard(self):
+        path = self._shard_path(len(self.shards)) if self.sharded else self.path
+        self._file = open_compressed(path, self.compression)
+        self.shards.append({'path': os.path.basename(path), 'records': 0, 'quotes': 0, 'bytes': 0})
+
+    def _resume(self, shards):
+        self.shards = copy_shards(shards)
+        last = self.shards[-1]
+        path = os.path.join(self.directory, last['path'])
+        if self.compression == 'none':
+            # Lines written after the last checkpoint are cut off
+            with open(path, 'r+b') as f:
+                f.truncate(last['bytes'])
+        else:
+            # A compressed shard cannot be cut in place (and may end abruptly), so its listed lines are written again
+            with open_compressed(path, self.compression, 'rt') as fin:
+                lines = [line for _, line in zip(range(last['records']), fin)]
+            with open_compressed(path + '.tmp', self.compression) as fout:
+                fout.write(''.join(lines))
+            os.replace(path + '.tmp', path)
+        if not self.sharded:
+            self._file = open(path, 'at', encoding='utf8')
+
+    def write(self, record: dict, n_quotes: int = None):
+        """ Adds `record` to the output. For the manifest, the record holds `n_quotes` quotes, by default the length of
+            its "quotes" field (as in the {"id": ..., "quotes": [...]} records of a corpus run).
+            Returns: (name of the shard, line of the record in the shard)
+        """
+        # The full buffer is written before, not after, adding the record, so that `on_flush` never sees a record
+        # its caller has not been handed the position of yet
+        if len(self._buffer) >= self.flush_every:
+            self.flush()
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        # Bytes of the UTF-8 JSON, before compression
+        size = len(line) if line.isascii() else len(line.encode('utf8'))
+        if self._file is None:
+            self._open_shard()
+        shard = self.shards[-1]
+        if self.shard_size is not None and shard['records'] and shard['bytes'] + size > self.shard_size:
+            self.flush()
+            self._file.close()
+            self._open_shard()
+            shard = self.shards[-1]
+        offset = shard['records']
+        shard['records'] += 1
+        shard['quotes'] += len(record.get('quotes', ())) if n_quotes is None else n_quotes
+        shard['bytes'] += size
+        self._buffer.append(line)
+        return shard['path'], offset
+
+    def supersede(self, shard_path: str, line: int):
+        """ Marks the record at `line` of the shard `shard_path` (a position returned by `write`) as replaced by a later
+            record, for the readers to skip it """
+        for shard in self.shards:
+            if shard['path'] == shard_path:
+                shard.setdefault('superseded', []).append(line)
+                return
+        raise ValueError(f"No shard '{shard_path}' in the output")
+
+    def flush(self):
+        if self._buffer:
+            self._file.write(''.join(self._buffer))
+            self._buffer = []
+            self._file.flush()
+            if self.on_flush is not None:
+                self.on_flush(self)
+
+    def close(self):
+        """ Writes the buffered records and, for sharded or compressed output, the manifest """
+        if self._file is None and not self.shards:
+            # Nothing was written: leave an empty output rather than none
+            self._open_shard()
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+        n_superseded = sum(len(shard.get('superseded', ())) for shard in self.shards)
+        if self.sharded or n_superseded:
+            # The counts are those of the lines of the shards, the superseded ones included
+            manifest = {'shards': self.shards,
+                        'compression': self.compression,
+                        'records': sum(shard['records'] for shard in self.shards),
+                        'quotes': sum(shard['quotes'] for shard in self.shards),
+                        'superseded': n_superseded}
+            # Written next to the shards and then renamed, so a reader never sees half a manifest
+            tmp_path = self.manifest_path + '.tmp'
+            with open(tmp_path, 'wt') as fout:
+                json.dump(manifest, fout, indent=2)
+            os.replace(tmp_path, self.manifest_path)
+            logging.info(f"{len(self.shards)} shards listed in {self.manifest_path}")
+        elif os.path.exists(self.manifest_path):
+            # Left by an earlier run whose lines this output replaced
+            os.remove(self.manifest_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def copy_shards(shards):
+    """ Returns: copies of the shard dicts of a ShardedJsonlWriter, with their own 'superseded' lists """
+    shards = [dict(shard) for shard in shards]
+    for shard in shards:
+        if 'superseded' in shard:
+            shard['superseded'] = list(shard['superseded'])
+    return shards
+
+
+def iter_shard(directory: str, shard: dict, compression: str = 'none'):
+    """ Stream the records of a shard listed in a manifest, skipping its superseded lines, e.g. to load the shards in
+        parallel.
+
+        :param directory: folder of the manifest and its shards
+        :param shard: shard dict of the manifest
+        :param compression: compression of the manifest
+        Returns: generator of dicts
+    """
+    superseded = frozenset(shard.get('superseded', ()))
+    with open_compressed(os.path.join(directory, shard['path']), compression, 'rt') as fin:
+        for line_no, line in zip(range(shard['records']), fin):
+            if line_no not in superseded:
+                yield json.loads(line)
+
+
+def iter_output(path: str):
+    """ Stream the records written by a ShardedJsonlWriter to `path`, from the shards listed in its manifest when there
+        is one, without the records replaced by a later one (see `ShardedJsonlWriter.supersede`).
+        Returns: generator of dicts
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    name = os.path.basename(path)
+    stem = name[:-len('.jsonl')] if name.endswith('.jsonl') else name
+    manifest_path = os.path.join(directory, f'{stem}.manifest.json')
+    if not os.path.exists(manifest_path):
+        with open(path, 'rt', encoding='utf8') as fin:
+            for line in fin:
+                yield json.loads(line)
+        return
+    with open(manifest_path, 'rt') as fin:
+        manifest = json.load(fin)
+    for shard in manifest['shards']:
+        yield from iter_shard(directory, shard, manifest['compression'])
+
+
+########################################################
+## Columnar export
+########################################################
+
+def _quote_schema():
+    import pyarrow as pa
+    # Speakers and cues repeat across a corpus, so they are stored as dictionaries (categories in pandas)
+    category = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([('article_id', pa.string()),
+                      ('quote_text', pa.string()),
+                      ('speaker', category),
+                      ('cue', category),
+                      ('additional_cue', category),
+                      ('quote_text_optional_second_part', pa.string()),
+                      ('quote_text_optional_third_part', pa.string()),
+                      ('QUOTE_TYPE', pa.int8()),
+                      ('start', pa.int64()),
+                      ('end', pa.int64()),
+                      ('speaker_id', category)])
+
+
+class ParquetQuoteWriter:
+    """ Writes one row per quote to a Parquet file, with the same interface as ShardedJsonlWriter, so that a query by
+        speaker or quote type reads only the columns it needs instead of loading the JSONL.
+        The speaker and cue columns are dictionary-encoded and the rows are written in row groups of `row_group_size`
+        quotes as the records come. `start` and `end` are the offsets of the quote text in the article, when the
+        quote dicts have them (see `extract_corpus`), and so is `speaker_id`, the canonical id of the speaker. Articles
+        without quotes have no rows. Needs the `pyarrow` package.
+
+        :param path: output file, e.g. ./data/quotes_results.parquet (its folder is created if needed)
+        :param row_group_size: number of quotes per row group
+        :param compression: Parquet compression codec (e.g. 'snappy', 'zstd', 'gzip', 'none')
+    """
+    def __init__(self, path: str, row_group_size: int = 100000, compression: str = 'snappy'):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Parquet output needs the 'pyarrow' package (pip install pyarrow)")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.row_group_size = row_group_size
+        self.schema = _quote_schema()
+        self._writer = pq.ParquetWriter(path, self.schema, compression=compression)
+        self._columns = {name: [] for name in self.schema.names}
+        self.n_rows = 0
+        self.n_row_groups = 0
+
+    def write(self, record: dict):
+        """ Adds the quotes of `record` ({"id": ..., "quotes": [...]}) to the output """
+        columns = self._columns
+        article_id = str(record['id'])
+        for quote in record.get('quotes', ()):
+            columns['article_id'].append(article_id)
+            for name in self.schema.names[1:]:
+                columns[name].append(quote.get(name))
+        if len(columns['article_id']) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        """ Writes the buffered quotes as a row group """
+        import pyarrow as pa
+        n_rows = len(self._columns['article_id'])
+        if n_rows == 0:
+            return
+        arrays = []
+        for field in self.schema:
+            values = self._columns[field.name]
+            if pa.types.is_dictionary(field.type):
+                arrays.append(pa.array(values, type=field.type.value_type).dictionary_encode())
+            else:
+                arrays.append(pa.array(values, type=field.type))
+        self._writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+        self._columns = {name: [] for name in self.schema.names}
+        self.n_rows += n_rows
+        self.n_row_groups += 1
+
+    def close(self):
+        """ Writes the buffered quotes and the Parquet footer """
+        self.flush()
+        self._writer.close()
+        logging.info(f"{self.n_rows} quotes in {self.n_row_groups} row groups written to {self.path}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()